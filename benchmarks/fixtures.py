@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pandas as pd
+import cooler
+import h5py
+
+
+def synthetic_chromsizes(n_chroms: int, chrom_length: int):
+    return pd.Series({f'chr{pos + 1}': chrom_length for pos in range(n_chroms)})
+
+
+def _synthetic_pixels(bins: pd.DataFrame, max_diag: int, rng: np.random.Generator):
+    # Убывающий с расстоянием контактный сигнал, по одной диагонали за раз
+    chrom_ids = pd.factorize(bins['chrom'])[0]
+    offsets = np.r_[0, np.flatnonzero(np.diff(chrom_ids)) + 1, len(bins)]
+    pixels = []
+    for lo, hi in zip(offsets[:-1], offsets[1:]):
+        for diag in range(min(max_diag, hi - lo)):
+            bin1 = np.arange(lo, hi - diag)
+            count = rng.poisson(200.0 / (diag + 1) ** 1.1, size=len(bin1))
+            mask = count > 0
+            pixels.append(pd.DataFrame(dict(bin1_id=bin1[mask], bin2_id=bin1[mask] + diag, count=count[mask])))
+    return pd.concat(pixels).sort_values(['bin1_id', 'bin2_id']).reset_index(drop=True)
+
+
+def _synthetic_weights(n_bins: int, nan_density: float, rng: np.random.Generator):
+    weight = rng.uniform(0.5, 1.5, n_bins) / 200
+    weight[rng.random(n_bins) < nan_density] = np.nan
+    # Протяжённый пропуск, как у центромеры
+    gap = max(1, int(n_bins * nan_density / 4))
+    start = rng.integers(0, max(1, n_bins - gap))
+    weight[start:start + gap] = np.nan
+    return weight
+
+
+def make_mcool(
+    path: str,
+    resolutions: list,
+    n_chroms: int = 3,
+    chrom_length: int = 10_000_000,  # Длина каждой хромосомы в п.н.
+    max_diag: int = 200,  # Сколько диагоналей заполнять на каждом разрешении
+    nan_density: float = 0.03,  # Доля бинов с NaN-весом
+    seed: int = 0
+):
+    rng = np.random.default_rng(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    chromsizes = synthetic_chromsizes(n_chroms, chrom_length)
+    for resolution in resolutions:
+        bins = cooler.binnify(chromsizes, resolution)
+        pixels = _synthetic_pixels(bins, max_diag, rng)
+        cooler.create_cooler(f'{path}::resolutions/{resolution}', bins, pixels, ordered=True, mode='a')
+        with h5py.File(path, 'r+') as outf:
+            outf[f'resolutions/{resolution}/bins'].create_dataset('weight', data=_synthetic_weights(len(bins), nan_density, rng))
+    return path
+
+
+def make_tracks(
+    storage_path: str,
+    cooler_name: str,
+    resolution: int,
+    nan_density: float = 0.02,
+    seed: int = 0
+):
+    # Треки в форматах, которые читают StripesFeature и FountainsFeature
+    rng = np.random.default_rng(seed)
+    bins = cooler.Cooler(f'{storage_path}/{cooler_name}::resolutions/{resolution}').bins()[['chrom', 'start', 'end']][:]
+
+    stripes = bins.copy()
+    stripes['cross_score'] = rng.normal(size=len(bins))
+    stripes.loc[rng.random(len(bins)) < nan_density, 'cross_score'] = np.nan
+    stripes.to_csv(f'{storage_path}/stripes.bed', sep='\t', header=False, index=False)
+
+    fountains = bins.copy()
+    fountains['FS'] = rng.normal(size=len(bins))
+    fountains.to_csv(f'{storage_path}/fountains.tsv', sep='\t')
+    return 'stripes.bed', 'fountains.tsv'
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import time
+import numpy as np
+import cooler
+import torch
+from models.datastorage import DiscStorage
+from models.dataset import HiCMapDataset, BlockBatchSampler
+from models.features import StripesFeature, FountainsFeature
+from models.features.norms import NormTypes
+from models.integrity import VerifyTypes, FAST_HASH
+from .fixtures import make_mcool, make_tracks
+
+
+def peak_rss_mb():
+    # ru_maxrss в Linux в килобайтах; воркеры учитываются отдельно
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def _row_bytes(sample: dict):
+    return sum(value.nbytes for value in sample.values() if isinstance(value, np.ndarray))
+
+
+def _timed(fnc, n_items: int, n_bytes: int = None):
+    start = time.perf_counter()
+    fnc()
+    elapsed = time.perf_counter() - start
+    result = dict(seconds=elapsed, per_second=n_items / elapsed)
+    if n_bytes is not None:
+        result['mb_per_second'] = n_bytes / elapsed / 2 ** 20
+    return result
+
+
+def _features(storage_path: str, clr: cooler.Cooler):
+    stripes = StripesFeature(storage_path)
+    stripes.load('stripes.bed')
+    fountains = FountainsFeature(storage_path)
+    fountains.load('fountains.tsv', clr)
+    return [stripes, fountains]
+
+
+def bench_generation(args):
+    if os.path.exists(args.storage):
+        shutil.rmtree(args.storage)
+    os.makedirs(args.storage)
+    make_mcool(
+        f'{args.storage}/synthetic.mcool',
+        args.resolutions,
+        n_chroms=args.n_chroms,
+        chrom_length=args.chrom_length,
+        nan_density=args.nan_density,
+        seed=args.seed
+    )
+    make_tracks(args.storage, 'synthetic.mcool', args.resolution, seed=args.seed)
+
+    storage = DiscStorage(args.storage, 'synthetic.mcool', force_rewrite=True)
+    clr = cooler.Cooler(f'{args.storage}/synthetic.mcool::resolutions/{args.resolution}')
+    features = _features(args.storage, clr)
+    start = time.perf_counter()
+    storage.generate_dataset(
+        args.resolution,
+        args.window_size,
+        features,
+        force_rewrite=True,
+        n_workers=args.n_workers,
+        dtype=np.dtype(args.dtype),
+        packed=args.packed
+    )
+    elapsed = time.perf_counter() - start
+    return dict(windows=len(storage), seconds=elapsed, per_second=len(storage) / elapsed)
+
+
+def bench_reads(args):
+    storage = DiscStorage(args.storage, 'synthetic.mcool', verify=VerifyTypes[args.verify])
+    storage.load_index()
+    length = len(storage)
+    rng = np.random.default_rng(args.seed)
+    n_reads = args.n_reads
+    random_indices = rng.integers(0, length, n_reads)
+    sequential_indices = np.arange(n_reads) % length
+    row_bytes = _row_bytes(storage[0])
+    index = storage._index
+    fast_hash = storage._meta.get('fast_hash', FAST_HASH)
+
+    results = dict()
+    # SAMPLED разрешается в FULL/NONE на каждое чтение, как в StorageReader
+    results['get_row_random'] = _timed(
+        lambda: [index[idx].get_row(
+            int(idx), storage.map_array, NormTypes.NONE, *storage.features,
+            verify=storage._read_verify_type(), fast_hash=fast_hash, layout=storage.layout
+        ) for idx in random_indices],
+        n_reads, n_reads * row_bytes
+    )
+    results['getitem_random'] = _timed(lambda: [storage[int(idx)] for idx in random_indices], n_reads, n_reads * row_bytes)
+    results['getitem_sequential'] = _timed(lambda: [storage[int(idx)] for idx in sequential_indices], n_reads, n_reads * row_bytes)
+    batches = [random_indices[lo:lo + args.batch_size] for lo in range(0, n_reads, args.batch_size)]
+    results['get_batch_random'] = _timed(lambda: [storage.get_batch(batch) for batch in batches], n_reads, n_reads * row_bytes)
+    batches = [sequential_indices[lo:lo + args.batch_size] for lo in range(0, n_reads, args.batch_size)]
+    results['get_batch_sequential'] = _timed(lambda: [storage.get_batch(batch) for batch in batches], n_reads, n_reads * row_bytes)
+    return results
+
+
+def bench_dataloader(args):
+    storage = DiscStorage(args.storage, 'synthetic.mcool', verify=VerifyTypes[args.verify])
+    storage.load_index()
+    dataset = HiCMapDataset(
+        storage.clr,
+        storage,
+        args.window_size,
+        lambda row: True,
+        storage.features,
+        NormTypes.ZNORM,
+        False
+    )
+    n_samples = len(dataset)
+    row_bytes = _row_bytes(storage[0])
+
+    def _epoch(loader):
+        for _ in loader:
+            pass
+
+    results = dict()
+    loader = torch.utils.data.DataLoader(dataset, batch_size=args.batch_size, shuffle=True, num_workers=args.loader_workers)
+    results['dataloader_shuffle'] = _timed(lambda: _epoch(loader), n_samples, n_samples * row_bytes)
+    sampler = BlockBatchSampler(n_samples, args.batch_size)
+    loader = torch.utils.data.DataLoader(dataset, batch_sampler=sampler, num_workers=args.loader_workers)
+    results['dataloader_block'] = _timed(lambda: _epoch(loader), n_samples, n_samples * row_bytes)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of DiscStorage generation and read paths on synthetic data')
+    parser.add_argument('--storage', default='bench_storage', help='Directory for the synthetic storage')
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--resolution', type=int, default=10000, help='Resolution used for generation')
+    parser.add_argument('--n-chroms', type=int, default=3)
+    parser.add_argument('--chrom-length', type=int, default=10_000_000)
+    parser.add_argument('--nan-density', type=float, default=0.03)
+    parser.add_argument('--window-size', type=int, default=64)
+    parser.add_argument('--n-workers', type=int, default=1, help='Generation processes')
+    parser.add_argument('--dtype', default='float64')
+    parser.add_argument('--packed', action='store_true')
+    parser.add_argument('--verify', default='FULL', choices=[verify.name for verify in VerifyTypes])
+    parser.add_argument('--n-reads', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--loader-workers', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-generation', action='store_true', help='Reuse an existing storage')
+    parser.add_argument('--output', default=None, help='Write results as JSON')
+    args = parser.parse_args()
+
+    results = dict(params=vars(args))
+    if not args.skip_generation:
+        results['generation'] = bench_generation(args)
+    results['reads'] = bench_reads(args)
+    results['dataloader'] = bench_dataloader(args)
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    if args.output is not None:
+        with open(args.output, 'w') as outf:
+            json.dump(results, outf, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
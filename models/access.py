@@ -0,0 +1,23 @@
+import mmap
+from enum import Enum
+import numpy as np
+
+
+class AccessModes(Enum):
+    RANDOM = 0  # Перемешанные индексы: readahead ядра только мешает
+    SEQUENTIAL = 1  # Подряд идущие окна (BlockBatchSampler, валидация)
+
+
+_ADVICE = {
+    AccessModes.RANDOM: getattr(mmap, 'MADV_RANDOM', None),
+    AccessModes.SEQUENTIAL: getattr(mmap, 'MADV_SEQUENTIAL', None)
+}
+
+
+def madvise(array: np.memmap, mode: AccessModes):
+    # Подсказка действует на конкретное отображение, а не на файл: каждый процесс
+    # должен применить её к своим memmap
+    mapped = getattr(array, '_mmap', None)
+    advice = _ADVICE[mode]
+    if mapped is not None and advice is not None:
+        mapped.madvise(advice)
@@ -0,0 +1,91 @@
+import numpy as np
+import cooler
+from collections import OrderedDict
+
+
+# Плотный квадрат вокруг диагонали: при сдвиге окна вправо из cooler
+# догружается только новая полоса, прочитанные пиксели переиспользуются
+class BandReader():
+
+    def __init__(
+        self,
+        clr: cooler.Cooler,
+        size: int,  # Максимальный размер запрашиваемого квадрата (в бинах)
+        readahead: int = None,  # Сколько бинов догружать сверх запрошенного
+        balance: bool = True
+    ):
+        self.size = size
+        self.readahead = size if readahead is None else readahead
+        self.n_bins = clr.shape[0]
+        self._matrix = clr.matrix(balance=balance)
+        capacity = self.size + self.readahead
+        self._band = np.empty((capacity, capacity), dtype=np.float64)
+        self._lo = 0
+        self._hi = 0
+
+    def fetch(self, lo: int, hi: int):
+        if hi - lo > self.size:
+            raise ValueError(f'Requested square {hi - lo} is larger than band size {self.size}')
+
+        if lo < self._lo or lo > self._hi:
+            self._lo = self._hi = lo
+
+        if hi > self._hi:
+            # Буфер сдвигается только перед догрузкой полосы: пока запрос помещается
+            # в уже прочитанное, окна отдаются срезом без копирования
+            if lo > self._lo:
+                shift = lo - self._lo
+                kept = self._hi - lo
+                self._band[:kept, :kept] = self._band[shift:shift + kept, shift:shift + kept]
+                self._lo = lo
+            new_hi = min(self._lo + self.size + self.readahead, self.n_bins)
+            strip = self._matrix[self._lo:new_hi, self._hi:new_hi]
+            old, new = self._hi - self._lo, new_hi - self._lo
+            self._band[:new, old:new] = strip
+            self._band[old:new, :old] = strip[:old, :].T
+            self._hi = new_hi
+
+        return self._band[lo - self._lo:hi - self._lo, lo - self._lo:hi - self._lo]
+
+
+# Произвольный доступ к окнам: плотные блоки вдоль диагонали в LRU,
+# каждый запрошенный квадрат целиком лежит в одном блоке
+class BandCache():
+
+    def __init__(
+        self,
+        clr: cooler.Cooler,
+        size: int,  # Максимальный размер запрашиваемого квадрата (в бинах)
+        step: int = None,  # Шаг блоков (в бинах); блок покрывает step + size бинов; None - 2 * size
+        max_bands: int = None,  # Сколько блоков держать в памяти; None - сколько помещается в max_bytes
+        balance: bool = True,
+        max_bytes: int = 256 * 2 ** 20
+    ):
+        self.size = size
+        self.step = 2 * size if step is None else step
+        band_bytes = (self.step + size) ** 2 * np.dtype(np.float64).itemsize
+        self.max_bands = max(1, max_bytes // band_bytes) if max_bands is None else max_bands
+        self.n_bins = clr.shape[0]
+        self._matrix = clr.matrix(balance=balance)
+        self._bands = OrderedDict()
+
+    def _band(self, block: int):
+        band = self._bands.get(block)
+        if band is not None:
+            self._bands.move_to_end(block)
+            return band
+        lo = block * self.step
+        hi = min(lo + self.step + self.size, self.n_bins)
+        band = self._matrix[lo:hi, lo:hi]
+        self._bands[block] = band
+        if len(self._bands) > self.max_bands:
+            self._bands.popitem(last=False)
+        return band
+
+    def fetch(self, lo: int, hi: int):
+        if hi - lo > self.size:
+            raise ValueError(f'Requested square {hi - lo} is larger than band size {self.size}')
+        block = lo // self.step
+        offset = lo - block * self.step
+        # Копия: вызывающий код может менять окно на месте
+        return self._band(block)[offset:offset + hi - lo, offset:offset + hi - lo].copy()
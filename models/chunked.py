@@ -0,0 +1,203 @@
+import os
+import zlib
+import lzma
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import blosc
+except ImportError:
+    blosc = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Кодеки из стандартной библиотеки доступны всегда, остальные - если установлены
+CODECS = ['zlib', 'lzma'] + [
+    name for name, module in [('blosc', blosc), ('lz4', lz4_frame), ('zstd', zstandard)]
+    if module is not None
+]
+CACHE_BYTES = 64 * 2 ** 20  # Объём LRU распакованных окон по умолчанию
+
+
+def _require(module, codec: str):
+    if module is None:
+        raise ImportError(f'{codec} is required to use this codec')
+    return module
+
+
+def compress(data: bytes, codec: str, level: int = None, itemsize: int = 8):
+    match codec:
+        case 'zlib':
+            return zlib.compress(data, 6 if level is None else level)
+        case 'lzma':
+            return lzma.compress(data, preset=6 if level is None else level)
+        case 'blosc':
+            return _require(blosc, codec).compress(data, typesize=itemsize, clevel=5 if level is None else level, shuffle=blosc.SHUFFLE)
+        case 'lz4':
+            return _require(lz4_frame, codec).compress(data, compression_level=0 if level is None else level)
+        case 'zstd':
+            return _require(zstandard, codec).ZstdCompressor(level=3 if level is None else level).compress(data)
+        case _:
+            raise ValueError(f'Unknown codec {codec}')
+
+
+def decompress(data: bytes, codec: str):
+    match codec:
+        case 'zlib':
+            return zlib.decompress(data)
+        case 'lzma':
+            return lzma.decompress(data)
+        case 'blosc':
+            return _require(blosc, codec).decompress(data)
+        case 'lz4':
+            return _require(lz4_frame, codec).decompress(data)
+        case 'zstd':
+            return _require(zstandard, codec).ZstdDecompressor().decompress(data)
+        case _:
+            raise ValueError(f'Unknown codec {codec}')
+
+
+# Сжатый массив окон: один чанк на окно, таблица смещений (сегмент, позиция, размер)
+# в memmap и сегментные файлы, каждый пишущий процесс дописывает только свой сегмент
+class ChunkedArray():
+    def __init__(
+        self,
+        path: str,  # Таблица смещений; сегменты лежат рядом как {path}.{segment}
+        length: int,
+        row_shape: tuple,
+        dtype,
+        codec: str,
+        level: int = None,
+        mode: str = 'r',
+        cache_size: int = None  # Сколько распакованных окон держать в LRU; None - на CACHE_BYTES
+    ):
+        self.filename = path
+        self.row_shape = tuple(row_shape)
+        self.shape = (length, *self.row_shape)
+        self.dtype = np.dtype(dtype)
+        self.codec = codec
+        self.level = level
+        self.mode = mode
+        if cache_size is None:
+            cache_size = max(1, CACHE_BYTES // (self.dtype.itemsize * int(np.prod(self.row_shape))))
+        self.cache_size = cache_size
+        if mode == 'w+' and codec not in CODECS:
+            raise ValueError(f'Codec {codec} is not available, choose one of {CODECS}')
+        self.table = np.memmap(path, mode=mode, dtype=np.int64, shape=(length, 3))
+        if mode == 'w+':
+            self.table[:] = -1
+            # Сегменты прошлой генерации с тем же путём больше не нужны
+            for segment_id in self._segment_ids():
+                os.remove(self._segment_path(segment_id))
+        self._segment = None
+        self._segment_id = None
+        self._readers = dict()
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getstate__(self):
+        # Открытые файлы не передаются в другие процессы, таблица переоткрывается по пути
+        state = self.__dict__.copy()
+        state.update(table=None, _segment=None, _segment_id=None, _readers=dict(), _cache=OrderedDict())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.table = np.memmap(self.filename, mode='r' if self.mode == 'r' else 'r+', dtype=np.int64, shape=(self.shape[0], 3))
+
+    def _segment_path(self, segment_id: int):
+        return f'{self.filename}.{segment_id}'
+
+    def _segment_ids(self):
+        prefix = f'{os.path.basename(self.filename)}.'
+        names = os.listdir(os.path.dirname(self.filename) or '.')
+        return [int(name[len(prefix):]) for name in names if name.startswith(prefix) and name[len(prefix):].isdigit()]
+
+    def truncate(self, length: int):
+        # Окна начиная с length забываются: при продолжении генерации они пишутся заново.
+        # Сегменты без ссылок из первых length окон удаляются, остальные обрезаются после
+        # последнего нужного чанка, иначе дописывание оставило бы в них мёртвые байты
+        if self.mode == 'r':
+            raise ValueError('Chunked array is opened read-only')
+        self.table[length:] = -1
+        table = np.asarray(self.table[:length])
+        table = table[table[:, 2] >= 0]
+        segment_ids, inverse = np.unique(table[:, 0], return_inverse=True)
+        ends = np.zeros(len(segment_ids), dtype=np.int64)
+        np.maximum.at(ends, inverse, table[:, 1] + table[:, 2])
+        ends = dict(zip(segment_ids.tolist(), ends.tolist()))
+        for segment_id in self._segment_ids():
+            if segment_id in ends:
+                os.truncate(self._segment_path(segment_id), ends[segment_id])
+            else:
+                os.remove(self._segment_path(segment_id))
+        self.table.flush()
+        self._cache.clear()
+
+    def __setitem__(self, idx: int, value: np.array):
+        if self.mode == 'r':
+            raise ValueError('Chunked array is opened read-only')
+        if self._segment is None:
+            # Номер сегмента - первое окно, записанное этим экземпляром, у воркеров они не пересекаются
+            self._segment_id = int(idx)
+            self._segment = open(self._segment_path(self._segment_id), 'ab')
+        data = np.ascontiguousarray(value, dtype=self.dtype).reshape(self.row_shape)
+        chunk = compress(data.tobytes(), self.codec, self.level, self.dtype.itemsize)
+        position = self._segment.tell()
+        self._segment.write(chunk)
+        self.table[idx] = (self._segment_id, position, len(chunk))
+        self._cache.pop(int(idx), None)
+
+    def _read_chunk(self, idx: int):
+        segment_id, position, size = self.table[idx]
+        if size < 0:
+            return np.zeros(self.row_shape, dtype=self.dtype)
+        reader = self._readers.get(segment_id)
+        if reader is None:
+            reader = open(self._segment_path(segment_id), 'rb')
+            self._readers[segment_id] = reader
+        reader.seek(position)
+        data = decompress(reader.read(size), self.codec)
+        return np.frombuffer(data, dtype=self.dtype).reshape(self.row_shape)
+
+    def _get_row(self, idx: int):
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        row = self._cache.get(idx)
+        if row is not None:
+            self._cache.move_to_end(idx)
+            return row
+        row = self._read_chunk(idx)
+        self._cache[idx] = row
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._get_row(key)
+        if isinstance(key, slice):
+            key = range(*key.indices(len(self)))
+        rows = [self._get_row(idx) for idx in key]
+        if len(rows) == 0:
+            return np.empty((0, *self.row_shape), dtype=self.dtype)
+        return np.stack(rows)
+
+    def flush(self):
+        if self._segment is not None:
+            self._segment.flush()
+            os.fsync(self._segment.fileno())
+        if self.mode != 'r':
+            self.table.flush()
@@ -1,8 +1,18 @@
+import numpy as np
 import torch
-import cooler
+from enum import Enum
 from typing import List
+from torch.utils.data import default_collate
 from .features.base import Feature
 from .features.norms import NormTypes
+from .metrics import Metrics, NULL_METRICS
+from .shared_cache import SharedWindowCache
+
+
+class FourierModes(Enum):
+    SAMPLE = 0  # fft по каждому объекту в __getitem__
+    BATCH = 1  # fft по всему батчу в fourier_collate
+    STORED = 2  # спектры карт, сохранённые при генерации хранилища
 
 
 def fft2d(x):
@@ -32,6 +42,27 @@ def fft1d(x):
     return x
 
 
+def fft2d_batch(x):
+    x = torch.fft.fft2(x)
+    x = torch.fft.fftshift(x, dim=(-2, -1))
+    return x
+
+
+def fft1d_batch(x):
+    # (batch, 1, line) -> (batch, line, 1), как fft1d для каждого объекта
+    batch = x.shape[0]
+    x = x.reshape(batch, -1)
+    x = torch.fft.fft(x)
+    x = torch.fft.fftshift(x, dim=-1)
+    x = x.reshape(batch, -1, 1)
+    return x
+
+
+def fourier_collate(batch):
+    item, *features = default_collate(batch)
+    return [fft2d_batch(item), *[fft1d_batch(obj) for obj in features]]
+
+
 def ifft1d(x):
     line = max(x.shape)
     x = x.reshape(line)
@@ -44,51 +75,202 @@ def ifft1d(x):
 class HiCMapDataset(torch.utils.data.Dataset):
     def __init__(
         self,
-        cooler_entity: cooler.Cooler,
+        cooler_entity,  # cooler.Cooler или его URI; открывается только в get_description
         datastorage: str,
         window_size: int,
         split_fnc: callable,
         features_list: List[Feature],
         norm_type: NormTypes,
-        is_fourier: bool
+        is_fourier: bool,
+        fourier_mode: FourierModes = FourierModes.SAMPLE,
+        metrics: Metrics = NULL_METRICS,  # В воркерах DataLoader у каждого процесса своя копия
+        cache: SharedWindowCache = None,  # Общий для воркеров кэш готовых окон
+        map_norm: bool = False  # Нормировать и карты тем же norm_type по статистике хранилища
     ):
+        if cache is not None and cache.norm_type is not None and cache.norm_type != norm_type:
+            raise ValueError('Cache was created for another norm type')
+        if map_norm and not hasattr(datastorage, 'norm_map'):
+            raise ValueError('Storage has no map statistics for map normalization')
+        self.map_norm = map_norm
+        self.metrics = metrics
+        self.cache = cache
         self.features = features_list
         self.norm_type = norm_type
         self.is_fourier = is_fourier
-        self.clr = cooler_entity
+        self.fourier_mode = fourier_mode
+        if isinstance(cooler_entity, str):
+            self.cooler_uri = cooler_entity
+            self._clr = None
+        else:
+            self.cooler_uri = f'{cooler_entity.filename}::{cooler_entity.root}'
+            self._clr = cooler_entity
         self.datastorage = datastorage
-        self.bin = cooler_entity.binsize
         self._slice_size = window_size
-        self.new_index = {}
-        internal_idx = 0
-        for el in range(len(self.datastorage) - 1):
-            if split_fnc(self.datastorage[el]):
-                self.new_index[internal_idx] = el
-                internal_idx += 1
+        if getattr(split_fnc, 'vectorized', False):
+            metadata = self.datastorage.metadata()
+            mask = np.asarray(split_fnc(metadata), dtype=bool)
+            self.new_index = metadata['idx'].to_numpy()[mask]
+        else:
+            self.new_index = np.array([
+                el for el in range(len(self.datastorage))
+                if split_fnc(self.datastorage[el])
+            ], dtype=np.int64)
         self.length = len(self.new_index)
 
+    def __getstate__(self):
+        # Воркерам передаётся только URI, cooler импортируется при первом обращении
+        state = self.__dict__.copy()
+        state['_clr'] = None
+        return state
+
+    @property
+    def clr(self):
+        if self._clr is None:
+            import cooler
+            self._clr = cooler.Cooler(self.cooler_uri)
+        return self._clr
+
+    @property
+    def bin(self):
+        return self.clr.binsize
+
     def __len__(self):
         return self.length
 
     def __getitem__(self, idx):
-        from_storage = self.datastorage[self.new_index[idx], self.norm_type]
-        item = from_storage['map']
+        storage_idx = int(self.new_index[idx])
+        self.metrics.count('samples')
+        cached = None if self.cache is None else self.cache.get(storage_idx)
+        if cached is None:
+            with self.metrics.stage('dataset_read'):
+                from_storage = self.datastorage[storage_idx, self.norm_type]
+            item = from_storage['map']
+            features = [from_storage[el.name] for el in self.features]
+            if self.cache is not None:
+                self.cache.put(storage_idx, item, features)
+        else:
+            item, features = cached
+        if self.map_norm:
+            item = self.datastorage.norm_map(item, self.norm_type)
         item = torch.from_numpy(item).reshape(1, self._slice_size, self._slice_size).float()
-        features = [from_storage[el.name] for el in self.features]
         features = [torch.from_numpy(obj).reshape((1, self._slice_size)).float() for obj in features]
-        if self.is_fourier:
-            features = [fft1d(obj) for obj in features]
-            item = fft2d(item)
+        if self.is_fourier and self.fourier_mode != FourierModes.BATCH:
+            with self.metrics.stage('fourier'):
+                features = [fft1d(obj) for obj in features]
+                if self.fourier_mode == FourierModes.STORED:
+                    item = self.datastorage.get_fourier([storage_idx])[0]
+                    item = torch.from_numpy(item).reshape(1, self._slice_size, self._slice_size)
+                else:
+                    item = fft2d(item)
         return item, *features
 
+    def __getitems__(self, indices):
+        storage_indices = [self.new_index[idx] for idx in indices]
+        self.metrics.count('samples', len(storage_indices))
+        batch = self._read_batch(storage_indices)
+        if self.map_norm:
+            batch['map'] = self.datastorage.norm_map(batch['map'], self.norm_type)
+        items = torch.from_numpy(batch['map']).reshape(-1, 1, self._slice_size, self._slice_size).float()
+        features = [
+            torch.from_numpy(batch[el.name]).reshape(-1, 1, self._slice_size).float()
+            for el in self.features
+        ]
+        if self.is_fourier and self.fourier_mode != FourierModes.BATCH:
+            with self.metrics.stage('fourier'):
+                features = [fft1d_batch(obj) for obj in features]
+                if self.fourier_mode == FourierModes.STORED:
+                    items = self.datastorage.get_fourier(storage_indices)
+                    items = torch.from_numpy(items).reshape(-1, 1, self._slice_size, self._slice_size)
+                else:
+                    items = fft2d_batch(items)
+        return [
+            (items[pos], *[obj[pos] for obj in features])
+            for pos in range(len(indices))
+        ]
+
+    def _read_batch(self, storage_indices):
+        if self.cache is None:
+            with self.metrics.stage('dataset_read'):
+                return self.datastorage.get_batch(storage_indices, self.norm_type)
+        # Из хранилища читаются только окна, которых нет в кэше
+        cached = [self.cache.get(idx) for idx in storage_indices]
+        missing = [pos for pos, value in enumerate(cached) if value is None]
+        if missing:
+            with self.metrics.stage('dataset_read'):
+                batch = self.datastorage.get_batch([storage_indices[pos] for pos in missing], self.norm_type)
+            for batch_pos, pos in enumerate(missing):
+                item = batch['map'][batch_pos]
+                features = [batch[el.name][batch_pos] for el in self.features]
+                self.cache.put(storage_indices[pos], item, features)
+                cached[pos] = (item, features)
+        out = dict(map=np.stack([np.asarray(item, dtype=np.float32) for item, _ in cached]))
+        for feature_pos, el in enumerate(self.features):
+            out[el.name] = np.stack([np.asarray(features[feature_pos], dtype=np.float32) for _, features in cached])
+        return out
+
+    def _window_index(self, idx):
+        # Индекс окон и номер окна в нём; у ShardedStorage - индекс шарда, где лежит окно
+        storage_idx = int(self.new_index[idx])
+        if hasattr(self.datastorage, 'shard_window_index'):
+            return self.datastorage.shard_window_index(storage_idx)
+        if hasattr(self.datastorage, 'window_index'):
+            return self.datastorage.window_index(), storage_idx
+        return None, storage_idx
+
     def get_coordinates(self, idx):
-        from_datastorage = self.datastorage[self.new_index[idx]]
+        index, storage_idx = self._window_index(idx)
+        if index is not None:
+            return index.start_position[storage_idx], index.end_position[storage_idx]
+        from_datastorage = self.datastorage[storage_idx]
         start_coord, end_coord = from_datastorage['start_position'], from_datastorage['end_position']
         return start_coord, end_coord
 
     def get_description(self, idx):
+        index, storage_idx = self._window_index(idx)
+        if index is not None:
+            # Координаты из индекса окон, без чтения окна и таблицы бинов
+            start_coord, end_coord = index.start_position[storage_idx], index.end_position[storage_idx]
+            chrom, start, end = index.bins([start_coord, end_coord])
+            return dict(chrom=str(chrom[0]), start=int(start[0])), dict(chrom=str(chrom[1]), end=int(end[1]))
         start_coord, end_coord = self.get_coordinates(idx)
         bins = self.clr.bins()
         start_desc = bins[start_coord][['chrom', 'start']].to_dict(orient='records')[0]
         end_desc = bins[end_coord][['chrom', 'end']].to_dict(orient='records')[0]
         return start_desc, end_desc
+
+
+# Батчи из подряд идущих индексов датасета: чтение из хранилища почти последовательное,
+# а случайность обеспечивается перемешиванием порядка батчей и сдвигом их границ по эпохам
+class BlockBatchSampler(torch.utils.data.Sampler):
+    def __init__(
+        self,
+        length: int,
+        batch_size: int,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        generator: torch.Generator = None
+    ):
+        self.length = length
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = generator
+
+    def __iter__(self):
+        offset = 0
+        if self.shuffle and self.length > self.batch_size:
+            offset = int(torch.randint(self.batch_size, (1, ), generator=self.generator))
+        # Индексы до offset уходят в хвост, поэтому число батчей не зависит от сдвига
+        order = list(range(offset, self.length)) + list(range(offset))
+        batches = [order[start:start + self.batch_size] for start in range(0, self.length, self.batch_size)]
+        if self.drop_last:
+            batches = [batch for batch in batches if len(batch) == self.batch_size]
+        if self.shuffle:
+            order = torch.randperm(len(batches), generator=self.generator).tolist()
+            batches = [batches[pos] for pos in order]
+        yield from batches
+
+    def __len__(self):
+        if self.drop_last:
+            return self.length // self.batch_size
+        return (self.length + self.batch_size - 1) // self.batch_size
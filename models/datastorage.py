@@ -1,91 +1,165 @@
 import numpy as np
-import hashlib
 import cooler
 from typing import List
 import os
-import pickle
 import json
+from concurrent.futures import ProcessPoolExecutor
 from .features.base import Feature
 from .features.norms import NormTypes
-from .utils import hic_transform
-
-
-class DiscRow():
-    idx: int
-    start_position: int
-    end_position: int
-
-    def __init__(self, idx, start_position, end_position, *features):
-        self.idx = int(idx)
-        self.start_position = start_position
-        self.end_position = end_position
-        self.map = None
-        for el in features:
-            self.__setattr__(el.name, None)
-
-    def set_feature(self, name, val):
-        self.__setattr__(name, val)
-
-    def set_map(self, map):
-        self.map = hashlib.sha256(map).hexdigest()
-
-    def to_dict(self):
-        return self.__dict__.copy()
-
-    @classmethod
-    def from_json(self, json_name):
-        with open(json_name, 'r') as inf:
-            files = json.load(inf)
-        blank = dict()
-        for key, val in files.items():
-            blank[int(key)] = object.__new__(DiscRow)
-            blank[int(key)].__dict__.update(val)
-        return blank
-
-    def get_row(
+from .utils import hic_transform, select_windows
+from .band import BandReader
+from .expected import ExpectedTable, ExpectedTypes
+from .integrity import VerifyTypes, FAST_HASH
+from .layout import MapLayout
+from .index import DiscRow, DiscIndex
+from .stats import RunningStats
+from .metrics import Metrics, NULL_METRICS
+from .reader import StorageReader
+
+
+def _window_borders(idx: int, window_size: int):
+    left_border = window_size * idx // 2
+    return left_border, left_border + window_size
+
+
+class _WindowWriter():
+    def __init__(
         self,
-        idx: int,
+        reader: BandReader,
+        layout: MapLayout,
         map_array: np.memmap,
-        norm_type: NormTypes,
-        *features
+        expected_table: ExpectedTable = None,
+        fourier_array: np.memmap = None,
+        metrics: Metrics = NULL_METRICS
     ):
-        out = dict()
-        if self.idx != idx:
-            raise ValueError('Wrong idx')
-        out['idx'] = idx
-        map = np.ascontiguousarray(map_array[idx, :, :])
-        if self.map != hashlib.sha256(map).hexdigest():
-            raise ValueError('Something wrong with map array')
-        out['map'] = map
-        out['start_position'] = self.start_position
-        out['end_position'] = self.end_position
-
-        for feature in features:
-            feature_name = feature.name
-            if feature_name not in self.__dict__:
-                raise ValueError(f'No such feature {feature_name}')
-            feature_val = np.ascontiguousarray(feature.get_feature_by_index(idx))
-            if hashlib.sha256(feature_val).hexdigest() != self.__getattribute__(feature_name):
-                raise ValueError(f'Wrong feature {feature_name}')
-            feature_val = feature.norm(feature_val, norm_type)
-            out[feature_name] = feature_val
-        return out
-
-
-class DiscStorage():
+        self.reader = reader
+        self.layout = layout
+        self.map_array = map_array
+        self.expected_table = expected_table
+        self.fourier_array = fourier_array
+        self.stats = RunningStats()
+        self.metrics = metrics
+
+    def write(self, idx: int, offset: int, row: DiscRow):
+        window_size = self.layout.window_size
+        left_border, right_border = _window_borders(idx, window_size)
+        with self.metrics.stage('fetch'):
+            item = self.reader.fetch(left_border - window_size, right_border + window_size)
+
+        expected = None
+        if self.expected_table is not None:
+            expected = self.expected_table.window(left_border - window_size, right_border + window_size)
+        verdict, item = hic_transform(item, window_size, expected, self.metrics)
+        if not verdict:
+            raise ValueError(f'Window {idx} was accepted by pre-pass but rejected by hic_transform')
+
+        self.stats.update(item)
+        item = self.layout.pack(item)
+        row.set_position(offset, left_border, right_border)
+        with self.metrics.stage('map_write'):
+            self.map_array[offset] = item
+        with self.metrics.stage('map_hash'):
+            row.set_map(item)
+        if self.fourier_array is not None:
+            with self.metrics.stage('spectrum'):
+                self.fourier_array[offset] = self.layout.spectrum(item)
+        self.metrics.count('windows_written')
+        self.metrics.count('bytes_written', item.nbytes)
+        return True
+
+
+def _generate_block(
+    cooler_uri: str,
+    maps_path: str,
+    length: int,
+    layout: MapLayout,
+    feature_names: List[str],
+    expected_table: ExpectedTable,
+    fourier_path: str,
+    windows: np.array,
+    first: int,
+    metrics: Metrics = NULL_METRICS
+):
+    # Позиции принятых окон известны заранее, воркер пишет их со смещения first
+    reader = BandReader(cooler.Cooler(cooler_uri), 3 * layout.window_size)
+    map_array = layout.open_memmap(maps_path, length, mode='r+')
+    fourier_array = None
+    if fourier_path is not None:
+        fourier_array = layout.open_fourier_memmap(fourier_path, length, mode='r+')
+    writer = _WindowWriter(reader, layout, map_array, expected_table, fourier_array, metrics)
+
+    index = DiscIndex.empty(len(windows), feature_names)
+    for pos, idx in enumerate(windows):
+        writer.write(idx, first + pos, index[pos])
+
+    map_array.flush()
+    if fourier_array is not None:
+        fourier_array.flush()
+    return index.records, writer.stats, metrics
+
+
+def _verify_block(
+    maps_path: str,
+    memmap_length: int,
+    layout: MapLayout,
+    features: List[Feature],
+    records: np.ndarray
+):
+    map_array = layout.open_memmap(maps_path, memmap_length)
+    for feature in features:
+        feature.load_memmap(mode='r')
+
+    broken = []
+    for pos in range(len(records)):
+        row = DiscRow(records, pos)
+        try:
+            values = row.get_row(row.idx, map_array, NormTypes.NONE, *features)
+        except ValueError:
+            broken.append(row.idx)
+            continue
+        # Нормированные копии сверяются с пересчётом из проверенных исходных строк
+        if any(
+            not np.array_equal(
+                feature.norm_memmap(NormTypes[name])[row.idx],
+                feature.norm_copy(values[feature.name], NormTypes[name]),
+                equal_nan=True
+            )
+            for feature in features for name in feature.normalized
+        ):
+            broken.append(row.idx)
+    return broken
+
+
+class DiscStorage(StorageReader):
 
     def __init__(
         self,
         storage_path: str,
         cooler_name: str,
-        force_rewrite: bool = False
+        force_rewrite: bool = False,
+        verify: VerifyTypes = VerifyTypes.FULL,  # Проверка хешей при чтении
+        verify_every: int = 100,  # Для VerifyTypes.SAMPLED: проверять каждое N-ое чтение
+        metrics: Metrics = NULL_METRICS  # Сбор времени по стадиям и счётчиков
     ):
-
-        self.storage_path = storage_path
-        self.cooler_name = cooler_name
-        self.storage_path = self.storage_path.rstrip('/')
-        if not os.path.exists(self.storage_path):
-            raise FileNotFoundError('Storage directory did not exists')
+        storage_path = storage_path.rstrip('/')
+        # Отсутствие каталога проверяет StorageReader
+        if force_rewrite and os.path.isdir(storage_path):
+            if os.path.exists(f'{storage_path}/meta.json'):
+                os.remove(f'{storage_path}/meta.json')
+            if os.path.exists(f'{storage_path}/.maps.npy'):
+                os.remove(f'{storage_path}/.maps.npy')
+            if os.path.exists(f'{storage_path}/.maps_fft.npy'):
+                os.remove(f'{storage_path}/.maps_fft.npy')
+            for name in os.listdir(storage_path):
+                if name.startswith('.maps.chunks'):
+                    os.remove(f'{storage_path}/{name}')
+            for index_name in ['index.json', 'index.npy', 'checkpoint.json', 'checkpoint.npy', 'window_index.npz']:
+                if os.path.exists(f'{storage_path}/{index_name}'):
+                    os.remove(f'{storage_path}/{index_name}')
+            if os.path.exists(f'{storage_path}/features.pkl'):
+                os.remove(f'{storage_path}/features.pkl')
+
+        super().__init__(storage_path, cooler_name, verify, verify_every, metrics)
 
         if not os.path.exists(f'{self.storage_path}/tmp'):
             os.mkdir(f'{self.storage_path}/tmp')
@@ -93,103 +167,312 @@ class DiscStorage():
         if not os.path.exists(f'{self.storage_path}/{self.cooler_name}'):
             raise FileNotFoundError('Cooler file did not exists')
 
-        if force_rewrite:
-            if os.path.exists(f'{self.storage_path}/meta.json'):
-                os.remove(f'{self.storage_path}/meta.json')
-            if os.path.exists(f'{self.storage_path}/.maps.npy'):
-                os.remove(f'{self.storage_path}/.maps.npy')
-            if os.path.exists(f'{self.storage_path}/.features.pkl'):
-                os.remove(f'{self.storage_path}/.features.pkl')
-
-        if os.path.exists(self.storage_path+'/meta.json'):
-            with open(self.storage_path+'/meta.json', 'r') as inf:
-                self._meta = json.load(inf)
-        else:
-            self._meta = dict()
-
     def generate_dataset(
         self,
         resolution: int,  # Разрешение HiC-карты
         window_size: int,  # Размер окна (в бинах)
         features: List[Feature],
-        force_rewrite: bool = False
+        force_rewrite: bool = False,
+        n_workers: int = 1,  # Число процессов генерации
+        block_size: int = 256,  # Число окон-кандидатов на одну задачу воркера
+        expected: ExpectedTypes = ExpectedTypes.WINDOW,
+        dtype=np.float64,  # Тип данных карт и признаков на диске
+        packed: bool = False,  # Хранить только верхний треугольник карты
+        fourier: bool = False,  # Сохранить спектры карт для is_fourier датасетов
+        resume: bool = False,  # Продолжить с последней контрольной точки
+        checkpoint_every: int = 1000,  # Раз во сколько окон сохранять контрольную точку
+        normalized: List[NormTypes] = (),  # Для каких нормировок сохранить готовые копии признаков
+        compression: str = None,  # Кодек сжатия карт по окнам (см. models.chunked.CODECS)
+        compression_level: int = None
+    ):
+        windows = self._setup_generation(
+            resolution, window_size, features, expected, dtype, packed, fourier, compression, compression_level
+        )
+        length = len(windows)
+
+        self._checkpoint_every = checkpoint_every
+        self._checkpoint_params = dict(
+            resolution=resolution,
+            window_size=window_size,
+            length=length,
+            expected=expected.name,
+            features=[ft.name for ft in self.features],
+            **self.layout.to_dict()
+        )
+        cursor, records, self.map_stats = 0, None, RunningStats()
+        if resume:
+            cursor, records, self.map_stats = self._load_checkpoint()
+        mode = 'w+' if records is None else 'r+'
+
+        self.map_array = self.layout.open_memmap(f'{self.storage_path}/{self._meta["maps"]}', length, mode=mode)
+        if records is not None and self.layout.compression is not None:
+            # Окна после контрольной точки пишутся заново, их старые чанки отбрасываются
+            self.map_array.truncate(cursor)
+        self.fourier_array = None
+        if fourier:
+            self.fourier_array = self.layout.open_fourier_memmap(f'{self.storage_path}/{self._meta["maps_fft"]}', length, mode=mode)
+        for ft in self.features:
+            ft.create_memmap(window_size, length, force_rewrite or records is not None, dtype)
+
+        self._expected_table = None
+        if expected == ExpectedTypes.CHROMOSOME:
+            self._expected_table = self.load_expected(resolution, 3 * window_size)
+
+        print(f'Start processing {self.cooler_name}, determine {length} windows')
+        if n_workers > 1:
+            self._generate_parallel(windows, n_workers, block_size, cursor, records)
+        else:
+            self._generate_serial(windows, cursor, records)
+        self._finish_generation(length, normalized)
+        self._remove_checkpoint()
+        if self.metrics.enabled:
+            print(self.metrics.log_line())
+
+    def _setup_generation(
+        self,
+        resolution: int,
+        window_size: int,
+        features: List[Feature],
+        expected: ExpectedTypes,
+        dtype,
+        packed: bool,
+        fourier: bool,
+        compression: str = None,
+        compression_level: int = None
     ):
+        # Метаданные хранилища и отбор окон; возвращает индексы принятых окон
         self.features = features
         self._meta['resolution'] = resolution
         self._meta['cooler'] = self.cooler_name
         self._meta['window_size'] = window_size
-        self._meta['maps'] = '.maps.npy'
+        self._meta['expected'] = expected.name
+        self._meta['fast_hash'] = FAST_HASH
+        self.layout = MapLayout(window_size, dtype, packed, fourier, compression, compression_level)
+        self._meta['maps'] = self.layout.maps_name
+        self._meta.update(self.layout.to_dict())
+        if fourier:
+            self._meta['maps_fft'] = '.maps_fft.npy'
 
-        self.clr = cooler.Cooler(f'{self.storage_path}/{self.cooler_name}::resolutions/{resolution}')
+        self._cooler_uri = f'{self.storage_path}/{self.cooler_name}::resolutions/{resolution}'
+        self.clr = cooler.Cooler(self._cooler_uri)
 
         input_shape = self.clr.shape[0]
         raw_length = int(input_shape // window_size * 2)
+        return self._select_windows(window_size, raw_length)
 
-        self.map_array = np.memmap(f'{self.storage_path}/{self._meta["maps"]}', mode='w+', shape=(raw_length, window_size, window_size), dtype=np.float64)
-        for ft in self.features:
-            ft.create_memmap(window_size, raw_length, force_rewrite)
-
-        length = 0
-        self._index = dict()
-        print(f'Start processing {self.cooler_name}, determine {raw_length} windows')
-
-        for idx in range(2, raw_length-3):  # пропускаем первую и последнюю карты
-
-            left_border = window_size * idx // 2
-            right_border = left_border + window_size
-
-            item = self.clr.matrix(balance=True)[left_border - window_size:right_border + window_size, left_border - window_size:right_border + window_size]
-
-            verdict, item = hic_transform(item, window_size)
-
-            if verdict:
-                item = np.ascontiguousarray(item)
-                row = DiscRow(length, left_border, right_border, *features)
-                self.map_array[length, :, :] = item
-                row.set_map(item)
-
-                for feature in self.features:
-                    val = feature.save_position(left_border, right_border, length)
-                    row.set_feature(feature.name, val)
-                self._index[length] = row
-                length += 1
-
-            if length % 100 == 0:
-                print(f"Loaded {length} maps")
+    def _finish_generation(self, length: int, normalized: List[NormTypes] = ()):
+        # Признаки, статистика и индекс пишутся, когда все карты уже на диске
+        with self.metrics.stage('features'):
+            self._write_features()
         self._meta['length'] = length
         self.map_array.flush()
+        if self.fourier_array is not None:
+            self.fourier_array.flush()
         self._meta['memmap_shape'] = self.map_array.shape
+        self._meta['map_stats'] = dict(
+            min=self.map_stats.min,
+            max=self.map_stats.max,
+            mean=self.map_stats.mean,
+            std=self.map_stats.std
+        )
+        self._meta['normalized'] = [norm_type.name for norm_type in normalized if norm_type != NormTypes.NONE]
         for feature in self.features:
             feature.save_memmap()
             feature.generate_meta(self._meta['length'])
+            feature.save_normalized(normalized, self._meta['length'])
         self._meta['features'] = [
             ft.to_dict() for ft in self.features
         ]
 
-        with open(f'{self.storage_path}/index.json', 'w') as outf:
-            json.dump({key: obj.to_dict() for key, obj in self._index.items()}, outf)
+        self._index.save(f'{self.storage_path}/index.npy')
+        self.window_index(rebuild=True)
 
         with open(f'{self.storage_path}/meta.json', 'w') as outf:
             json.dump(self._meta, outf)
+        # Дальше хранилище работает как читатель: воркеры DataLoader (в том числе spawn)
+        # переоткрывают карты и StoredFeature по meta.json
+        self.load_index()
 
-        with open(f'{self.storage_path}/features.pkl', 'wb') as outf:
-            pickle.dump(self.features, outf)
-
-    def load_index(self):
-        self.clr = cooler.Cooler(f'{self.storage_path}/{self.cooler_name}::resolutions/{self._meta["resolution"]}')
-        self.map_array = np.memmap(f"{self.storage_path}/.maps.npy", mode='r', shape=tuple(self._meta['memmap_shape']), dtype=np.float64)
-        with open(f'{self.storage_path}/features.pkl', 'rb') as inf:
-            self.features = pickle.load(inf)
-        self._index = DiscRow.from_json(f'{self.storage_path}/index.json')
-
-    def __len__(self):
-        return self._meta['length']
-
-    def __getitem__(self, idx):
-        norm_type = NormTypes.NONE
-        if isinstance(idx, tuple):
-            idx, norm_type = idx
-        return self._index[idx].get_row(idx, self.map_array, norm_type, *self.features)
-
-    def fast_get(self, idx):
-        return self._index[idx].to_dict()
+    def _save_checkpoint(self, cursor: int, records: np.ndarray):
+        # Сначала сбрасываем карты на диск, затем атомарно пишем индекс и курсор
+        self.map_array.flush()
+        if self.fourier_array is not None:
+            self.fourier_array.flush()
+        with open(f'{self.storage_path}/checkpoint.tmp.npy', 'wb') as outf:
+            np.save(outf, records)
+        os.replace(f'{self.storage_path}/checkpoint.tmp.npy', f'{self.storage_path}/checkpoint.npy')
+        with open(f'{self.storage_path}/checkpoint.tmp.json', 'w') as outf:
+            json.dump(dict(
+                cursor=cursor,
+                length=len(records),
+                map_stats=self.map_stats.to_dict(),
+                params=self._checkpoint_params
+            ), outf)
+        os.replace(f'{self.storage_path}/checkpoint.tmp.json', f'{self.storage_path}/checkpoint.json')
+
+    def _load_checkpoint(self):
+        if not os.path.exists(f'{self.storage_path}/checkpoint.json'):
+            print('No checkpoint found, start from the beginning')
+            return 0, None, RunningStats()
+        with open(f'{self.storage_path}/checkpoint.json', 'r') as inf:
+            state = json.load(inf)
+        if state['params'] != self._checkpoint_params:
+            raise ValueError('Checkpoint was made with different generation parameters')
+        records = np.load(f'{self.storage_path}/checkpoint.npy')[:state['length']]
+        print(f'Resume from window {state["cursor"]}, {len(records)} maps already loaded')
+        return state['cursor'], records, RunningStats.from_dict(state['map_stats'])
+
+    def _remove_checkpoint(self):
+        for name in ['checkpoint.json', 'checkpoint.npy']:
+            if os.path.exists(f'{self.storage_path}/{name}'):
+                os.remove(f'{self.storage_path}/{name}')
+
+    def _select_windows(self, window_size: int, raw_length: int):
+        # Отбор окон по весам балансировки до чтения самих карт
+        candidates = np.arange(2, raw_length - 3)  # пропускаем первую и последнюю карты
+        weight = self.clr.bins()['weight'][:].to_numpy()
+        windows = select_windows(weight, window_size, candidates)
+        self.metrics.count('windows_accepted', len(windows))
+        self.metrics.count('windows_rejected', len(candidates) - len(windows))
+        self._meta['candidate_windows'] = len(candidates)
+        share = len(windows) / len(candidates) if len(candidates) else 0.0
+        print(f'Pre-pass: {len(windows)} of {len(candidates)} windows accepted ({share:.1%})')
+        return windows
+
+    def load_expected(self, resolution: int, max_diag: int):
+        # Ключ кэша включает контрольную сумму cooler: перезаписанный файл с тем же именем пересчитывается
+        from .features.derived import cooler_checksum
+        checksum = cooler_checksum(self.clr, f'{self.storage_path}/tmp')
+        expected_path = f'{self.storage_path}/tmp/expected_{self.cooler_name}_{resolution}_{max_diag}_{checksum[:16]}.npz'
+        if os.path.isfile(expected_path):
+            return ExpectedTable.load(expected_path)
+        expected_table = ExpectedTable.from_cooler(self.clr, max_diag)
+        expected_table.save(expected_path)
+        return expected_table
+
+    def _generate_serial(
+        self,
+        windows: np.array,
+        cursor: int,
+        records: np.ndarray = None
+    ):
+        reader = BandReader(self.clr, 3 * self.layout.window_size)
+        writer = _WindowWriter(reader, self.layout, self.map_array, self._expected_table, self.fourier_array, self.metrics)
+        index = DiscIndex.empty(len(windows), [feature.name for feature in self.features])
+        if records is not None:
+            index.records[:cursor] = records
+        writer.stats = self.map_stats
+        for length in range(cursor, len(windows)):
+            writer.write(windows[length], length, index[length])
+
+            if (length + 1) % 100 == 0:
+                print(f"Loaded {length + 1} maps")
+            if (length + 1) % self._checkpoint_every == 0:
+                self._save_checkpoint(length + 1, index.records[:length + 1])
+        self._index = index
+
+    def _generate_parallel(
+        self,
+        windows: np.array,
+        n_workers: int,
+        block_size: int,
+        cursor: int,
+        records: np.ndarray = None
+    ):
+        self.map_array.flush()
+        fourier_path = None
+        if self.fourier_array is not None:
+            self.fourier_array.flush()
+            fourier_path = self.fourier_array.filename
+
+        blocks = [
+            (first, min(first + block_size, len(windows)))
+            for first in range(cursor, len(windows), block_size)
+        ]
+        block_records = []
+        if records is not None:
+            block_records.append(records)
+        else:
+            block_records.append(DiscIndex.empty(0, [feature.name for feature in self.features]).records)
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [
+                executor.submit(
+                    _generate_block,
+                    self._cooler_uri,
+                    self.map_array.filename,
+                    len(windows),
+                    self.layout,
+                    [feature.name for feature in self.features],
+                    self._expected_table,
+                    fourier_path,
+                    windows[first:last],
+                    first,
+                    self.metrics.spawn()
+                )
+                for first, last in blocks
+            ]
+            checkpoint_cursor = cursor
+            for (first, last), future in zip(blocks, futures):
+                records, stats, metrics = future.result()
+                block_records.append(records)
+                self.map_stats.merge(stats)
+                self.metrics.merge(metrics)
+                print(f"Loaded {sum(len(records) for records in block_records)} maps")
+                if last - checkpoint_cursor >= self._checkpoint_every:
+                    self._save_checkpoint(last, np.concatenate(block_records))
+                    checkpoint_cursor = last
+
+        self._index = DiscIndex(np.concatenate(block_records))
+
+    def _write_features(self):
+        # Признаки всех принятых окон пишутся разом, после карт
+        records = self._index.records
+        for feature in self.features:
+            digests, fast_digests = feature.save_positions(records['start_position'], records['idx'], metrics=self.metrics)
+            records[feature.name] = digests
+            records[f'{feature.name}_fast'] = fast_digests
+
+    def add_feature(self, feature: Feature, force_rewrite: bool = False):
+        # Добавляет признак в готовое хранилище без пересчёта карт
+        if any(ft.name == feature.name for ft in self.features) and not force_rewrite:
+            raise ValueError(f'Feature {feature.name} already exists')
+        feature.create_memmap(self._meta['window_size'], self._meta['memmap_shape'][0], force_rewrite, self.layout.dtype)
+
+        index = self._index.with_feature(feature.name)
+        records = index.records[:len(self)]
+        digests, fast_digests = feature.save_positions(records['start_position'], records['idx'], metrics=self.metrics)
+        records[feature.name] = digests
+        if f'{feature.name}_fast' in records.dtype.names:
+            records[f'{feature.name}_fast'] = fast_digests
+        feature.save_memmap()
+        feature.generate_meta(len(self))
+        feature.save_normalized([NormTypes[name] for name in self._meta.get('normalized', [])], len(self))
+        feature.load_memmap(mode='r')
+
+        self.features = [ft for ft in self.features if ft.name != feature.name] + [feature]
+        self._meta['features'] = [
+            ft.to_dict() for ft in self.features
+        ]
+        index.save(f'{self.storage_path}/index.npy')
+        with open(f'{self.storage_path}/meta.json', 'w') as outf:
+            json.dump(self._meta, outf)
+        self.load_index()
+
+    def verify(self, n_jobs: int = 1, block_size: int = 1024):
+        # Полная проверка sha256 всего хранилища, возвращает индексы испорченных окон
+        records = self._index.records[:len(self)]
+        blocks = [np.array(records[first:first + block_size]) for first in range(0, len(records), block_size)]
+        maps_path = f'{self.storage_path}/{self._meta["maps"]}'
+        if n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [
+                    executor.submit(_verify_block, maps_path, len(self.map_array), self.layout, self.features, block)
+                    for block in blocks
+                ]
+                results = [future.result() for future in futures]
+        else:
+            results = [
+                _verify_block(maps_path, len(self.map_array), self.layout, self.features, block)
+                for block in blocks
+            ]
+        return [idx for broken in results for idx in broken]
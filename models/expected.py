@@ -0,0 +1,91 @@
+import numpy as np
+import cooler
+from enum import Enum
+
+
+class ExpectedTypes(Enum):
+    WINDOW = 0  # observed_over_expected по каждому окну 3w x 3w
+    CHROMOSOME = 1  # общая таблица по диагоналям для каждой хромосомы
+
+
+# Ожидаемый уровень контактов по диагоналям, посчитанный один раз на хромосому.
+# Для пар бинов из разных хромосом используется средний trans-контакт
+class ExpectedTable():
+    def __init__(
+        self,
+        chrom_ids: np.array,
+        cis: np.array,
+        trans: float
+    ):
+        self.chrom_ids = chrom_ids
+        self.cis = cis
+        self.trans = trans
+        self.max_diag = cis.shape[1]
+
+    @classmethod
+    def from_cooler(
+        cls,
+        clr: cooler.Cooler,
+        max_diag: int,  # Максимальная дистанция (в бинах), для которой нужен expected
+        chunksize: int = 10_000_000
+    ):
+        bins = clr.bins()[['chrom', 'weight']][:]
+        chrom_ids = bins['chrom'].cat.codes.to_numpy().astype(np.int64)
+        weight = bins['weight'].to_numpy()
+        valid = np.logical_not(np.isnan(weight))
+        n_chroms = len(clr.chromnames)
+
+        sums = np.zeros(n_chroms * max_diag, dtype=np.float64)
+        trans_sum = 0.0
+        pixels = clr.pixels()
+        for lo in range(0, clr.info['nnz'], chunksize):
+            chunk = pixels[lo:lo + chunksize]
+            bin1 = chunk['bin1_id'].to_numpy()
+            bin2 = chunk['bin2_id'].to_numpy()
+            value = chunk['count'].to_numpy() * weight[bin1] * weight[bin2]
+            finite = np.isfinite(value)
+            diag = bin2 - bin1
+            is_cis = chrom_ids[bin1] == chrom_ids[bin2]
+            near = finite & is_cis & (diag < max_diag)
+            sums += np.bincount(
+                chrom_ids[bin1[near]] * max_diag + diag[near],
+                weights=value[near],
+                minlength=n_chroms * max_diag
+            )
+            trans_sum += value[finite & np.logical_not(is_cis)].sum()
+        sums = sums.reshape(n_chroms, max_diag)
+
+        counts = np.zeros((n_chroms, max_diag), dtype=np.float64)
+        chrom_valid = np.zeros(n_chroms, dtype=np.float64)
+        for chrom_id in range(n_chroms):
+            chrom_mask = valid[chrom_ids == chrom_id]
+            chrom_valid[chrom_id] = chrom_mask.sum()
+            counts[chrom_id, 0] = chrom_mask.sum()
+            for diag in range(1, min(max_diag, len(chrom_mask))):
+                counts[chrom_id, diag] = np.logical_and(chrom_mask[:-diag], chrom_mask[diag:]).sum()
+
+        # Как и observed_over_expected, диагонали без данных не нормируем
+        cis = np.ones((n_chroms, max_diag), dtype=np.float64)
+        np.divide(sums, counts, out=cis, where=(counts > 0) & (sums > 0))
+
+        trans_pairs = (chrom_valid.sum() ** 2 - (chrom_valid ** 2).sum()) / 2
+        trans = trans_sum / trans_pairs if trans_pairs > 0 and trans_sum > 0 else 1.0
+        return cls(chrom_ids, cis, trans)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(data['chrom_ids'], data['cis'], float(data['trans']))
+
+    def save(self, path: str):
+        with open(path, 'wb') as outf:
+            np.savez(outf, chrom_ids=self.chrom_ids, cis=self.cis, trans=self.trans)
+
+    def window(self, lo: int, hi: int):
+        if hi - lo > self.max_diag:
+            raise ValueError(f'Window {hi - lo} is larger than expected table {self.max_diag}')
+        chrom_ids = self.chrom_ids[lo:hi]
+        positions = np.arange(hi - lo)
+        diag = np.abs(positions[:, None] - positions[None, :])
+        same_chrom = chrom_ids[:, None] == chrom_ids[None, :]
+        return np.where(same_chrom, self.cis[chrom_ids[:, None], diag], self.trans)
@@ -1,11 +1,28 @@
+from importlib import import_module
 from .base import Feature
-from .compartments import CompartmentFeature
-from .fountains import FountainsFeature
-from .insulation import InsulationFeature
-from .stripes import StripesFeature
+from .stored import StoredFeature
+
+# Признаки с расчётом треков тянут cooler, cooltools и bioframe, поэтому
+# импортируются при первом обращении, а чтение хранилища обходится numpy
+_LAZY = {
+    'CompartmentFeature': '.compartments',
+    'FountainsFeature': '.fountains',
+    'InsulationFeature': '.insulation',
+    'StripesFeature': '.stripes'
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
 
 __all__ = [
     'Feature',
+    'StoredFeature',
     'CompartmentFeature',
     'FountainsFeature',
     'InsulationFeature',
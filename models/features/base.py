@@ -2,17 +2,38 @@ from abc import ABC, abstractmethod
 import os
 import numpy as np
 import hashlib
+from numpy.lib.stride_tricks import sliding_window_view
 from .norms import NormTypes, empty_norm, minmax_norm, z_norm
+from ..integrity import sha256_digest, fast_digest
+from ..stats import RunningStats
+from ..metrics import Metrics, NULL_METRICS
 
 
 class Feature(ABC):
     name: str
     path: str
+    dtype: str = 'float64'  # Хранилища, созданные до выбора типа данных, всегда в float64
+    normalized: tuple = ()  # Имена NormTypes, для которых сохранена нормированная копия
 
     @abstractmethod
     def get_feature_by_postition(self, start: int, end: int):
         pass
 
+    def get_track(self):
+        # Непрерывный трек, выровненный по бинам cooler; None - только поконное чтение
+        return None
+
+    def transform_windows(self, windows: np.array):
+        # Преобразование уже нарезанных окон (n, window_size)
+        return windows
+
+    def get_windows(self, starts: np.array, window_size: int):
+        track = self.get_track()
+        if track is None:
+            return np.stack([self.get_feature_by_postition(start, start + window_size) for start in starts])
+        windows = sliding_window_view(track, window_size)[starts]
+        return self.transform_windows(windows)
+
     def to_dict(self):
         return dict(
             name=self.name,
@@ -21,23 +42,43 @@ class Feature(ABC):
             max=self.max,
             mean=self.mean,
             std=self.std,
-            memmap_shape=self.memmap_shape
+            memmap_shape=self.memmap_shape,
+            dtype=self.dtype,
+            normalized=list(self.normalized)
         )
 
+    def __getstate__(self):
+        # memmap переоткрывается через load_memmap, а не копируется при сериализации
+        state = self.__dict__.copy()
+        state.pop('memmap', None)
+        state.pop('norm_memmaps', None)
+        state.pop('stats', None)
+        return state
+
     def get_feature_by_index(self, id: int):
         return self.memmap[id, :]
 
-    def create_memmap(self, window_size: int, max_windows: int, force_rewrite: bool = False):
+    def create_memmap(self, window_size: int, max_windows: int, force_rewrite: bool = False, dtype=np.float64):
         if os.path.exists(self.path) and os.path.isfile(self.path):
             if force_rewrite:
                 os.remove(self.path)
             else:
                 raise FileExistsError(f'File {self.path} already exist')
-        self.memmap = np.memmap(self.path, mode='w+', dtype=np.float64, shape=(max_windows, window_size))
+        self.dtype = np.dtype(dtype).name
+        self.memmap = np.memmap(self.path, mode='w+', dtype=self.dtype, shape=(max_windows, window_size))
         self.memmap_shape = (max_windows, window_size)
+        self.stats = RunningStats()
+
+    def load_memmap(self, mode: str = 'r+'):
+        self.memmap = np.memmap(self.path, shape=self.memmap_shape, mode=mode, dtype=self.dtype)
+        self.norm_memmaps = {
+            NormTypes[name]: np.memmap(self.norm_path(NormTypes[name]), shape=self.memmap_shape, mode=mode, dtype=self.dtype)
+            for name in self.normalized
+        }
 
-    def load_memmap(self):
-        self.memmap = np.memmap(self.path, shape=self.memmap_shape, mode='r+')
+    def norm_path(self, norm_type: NormTypes):
+        root, ext = os.path.splitext(self.path)
+        return f'{root}.{norm_type.name.lower()}{ext}'
 
     def save_memmap(self):
         self.memmap.flush()
@@ -48,16 +89,65 @@ class Feature(ABC):
         end: int,
         idx: int
     ):
-        pos_arr = self.get_feature_by_postition(start, end)
+        pos_arr = np.ascontiguousarray(self.get_feature_by_postition(start, end), dtype=self.dtype)
         self.memmap[idx, :] = pos_arr
-        return hashlib.sha256(pos_arr).hexdigest()
+        return hashlib.sha256(pos_arr).digest()
+
+    def save_positions(
+        self,
+        starts: np.array,
+        idxs: np.array,
+        chunk_size: int = 4096,
+        metrics: Metrics = NULL_METRICS
+    ):
+        # Пишет все окна сразу, возвращает sha256 и быстрые хеши строк
+        window_size = self.memmap_shape[1]
+        digests = np.zeros((len(starts), hashlib.sha256().digest_size), dtype=np.uint8)
+        fast_digests = np.zeros(len(starts), dtype=np.uint64)
+        for lo in range(0, len(starts), chunk_size):
+            hi = min(lo + chunk_size, len(starts))
+            with metrics.stage(f'{self.name}_slice'):
+                windows = np.ascontiguousarray(self.get_windows(starts[lo:hi], window_size), dtype=self.dtype)
+            with metrics.stage(f'{self.name}_write'):
+                self.memmap[idxs[lo:hi], :] = windows
+            self.stats.update(windows)
+            with metrics.stage(f'{self.name}_hash'):
+                for pos, value in enumerate(windows, start=lo):
+                    digests[pos] = np.frombuffer(sha256_digest(value), dtype=np.uint8)
+                    fast_digests[pos] = fast_digest(value)
+            metrics.count('bytes_written', windows.nbytes)
+        return digests, fast_digests
 
     def generate_meta(self, length):
-        feature_slice = self.memmap[:length, :]
-        self.min = feature_slice.min()
-        self.max = feature_slice.max()
-        self.mean = feature_slice.mean()
-        self.std = feature_slice.std()
+        # Статистика копится при записи; полный проход только если окна писались по одному
+        stats = getattr(self, 'stats', None)
+        if stats is None or stats.count != length * self.memmap_shape[1]:
+            stats = RunningStats()
+            for lo in range(0, length, 4096):
+                stats.update(self.memmap[lo:min(lo + 4096, length), :])
+        self.min = stats.min
+        self.max = stats.max
+        self.mean = stats.mean
+        self.std = stats.std
+
+    def save_normalized(self, norm_types, length: int, chunk_size: int = 4096):
+        # Нормированные копии memmap: чтение становится срезом без арифметики
+        norm_types = [norm_type for norm_type in norm_types if norm_type != NormTypes.NONE]
+        for norm_type in norm_types:
+            norm_memmap = np.memmap(self.norm_path(norm_type), mode='w+', dtype=self.dtype, shape=self.memmap_shape)
+            for lo in range(0, length, chunk_size):
+                hi = min(lo + chunk_size, length)
+                norm_memmap[lo:hi] = self.norm_copy(self.memmap[lo:hi], norm_type)
+            norm_memmap.flush()
+        self.normalized = tuple(norm_type.name for norm_type in norm_types)
+
+    def norm_memmap(self, norm_type: NormTypes):
+        # Сохранённая нормированная копия или None, если нормировать нужно при чтении
+        return getattr(self, 'norm_memmaps', {}).get(norm_type)
+
+    def norm_copy(self, value, norm_type):
+        # Значения нормированной копии memmap, посчитанные из исходных строк
+        return self.norm(np.asarray(value, dtype=np.float64), norm_type).astype(self.dtype)
 
     def norm(self, value, norm_type):
         match norm_type:
@@ -1,11 +1,9 @@
 from .base import Feature
 from cooler import Cooler
-import cooltools
-import bioframe
 import os
-import pandas as pd
 import numpy as np
 from .utils import nan_interpolator
+from .derived import content_key, cooler_checksum, file_checksum, cached_frame, frac_gc, eigs_cis
 
 
 class CompartmentFeature(Feature):
@@ -23,39 +21,31 @@ class CompartmentFeature(Feature):
         cooler_obj: str,
         compartment_res: int,
         genome_name: str,
-        compartment_binarize: bool = False
+        compartment_binarize: bool = False,
+        n_workers: int = 1  # Процессы для покромосомного расчёта GC и собственных векторов
     ):
         self.compartment_binarize = compartment_binarize
         self.compartment_res = compartment_res
         clr_compartments = Cooler(f'{self.base_path}/{cooler_name}::resolutions/{compartment_res}')
         bins = clr_compartments.bins()[:]
-        if not os.path.isfile(f'{self.base_path}/{genome_name}_gc_cov_{compartment_res//1000}kb.tsv'):
-            genome = bioframe.load_fasta(f'{self.base_path}/{genome_name}')
-            gc_cov = bioframe.frac_gc(bins[['chrom', 'start', 'end']], genome)
-            gc_cov.to_csv(f'{self.base_path}/{genome_name}_gc_cov_{compartment_res//1000}kb.tsv', index=False, sep='\t')
-        else:
-            gc_cov = pd.read_csv(f'{self.base_path}/{genome_name}_gc_cov_{compartment_res//1000}kb.tsv', sep='\t')
-
-        if not os.path.isfile(f'{self.base_path}/tmp/{genome_name}_eigvec_{compartment_res//1000}kb.tsv')\
-           or not os.path.isfile(f'{self.base_path}/tmp/{genome_name}_eigval_{compartment_res//1000}kb.tsv'):
-            view_df = pd.DataFrame({'chrom': clr_compartments.chromnames,
-                                    'start': 0,
-                                    'end': clr_compartments.chromsizes.values,
-                                    'name': clr_compartments.chromnames}
-                                   )
-            cis_eigs = cooltools.eigs_cis(
-                clr_compartments,
-                gc_cov,
-                view_df=view_df,
-                n_eigs=3,
-                )
-            cis_eigs[0].to_csv(f'{self.base_path}/tmp/{genome_name}_eigval_{compartment_res//1000}kb.tsv', index=False, sep='\t')
-            cis_eigs[1].to_csv(f'{self.base_path}/tmp/{genome_name}_eigvec_{compartment_res//1000}kb.tsv', index=False, sep='\t')
-        else:
-            cis_eigs = (
-                pd.read_csv(f'{self.base_path}/tmp/{genome_name}_eigval_{compartment_res//1000}kb.tsv', sep='\t'),
-                pd.read_csv(f'{self.base_path}/tmp/{genome_name}_eigvec_{compartment_res//1000}kb.tsv', sep='\t')
-            )
+        tmp_path = f'{self.base_path}/tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+        fasta_path = f'{self.base_path}/{genome_name}'
+        gc_key = content_key(
+            'frac_gc',
+            file_checksum(fasta_path, tmp_path),
+            compartment_res,
+            dict(zip(clr_compartments.chromnames, clr_compartments.chromsizes.tolist()))
+        )
+        gc_cov = cached_frame(
+            tmp_path, f'{genome_name}_gc_cov', gc_key,
+            lambda: frac_gc(bins, fasta_path, n_workers)
+        )
+        eigs_key = content_key('eigs_cis', cooler_checksum(clr_compartments, tmp_path), gc_key, 3)
+        cis_eigs = cached_frame(
+            tmp_path, f'{genome_name}_eigvec', eigs_key,
+            lambda: eigs_cis(clr_compartments, gc_cov, 3, n_workers)[1]
+        )
 
         def compartment_interpolate(compartment_df, map_df):
             compartment_join = compartment_df[['chrom', 'start', 'end', 'E1', 'E2', 'E3']].copy()
@@ -68,18 +58,22 @@ class CompartmentFeature(Feature):
             joined['E2'] = nan_interpolator(joined['E2'].to_numpy())
             joined['E3'] = nan_interpolator(joined['E3'].to_numpy())
             return joined
-        self.compartment_table = compartment_interpolate(cis_eigs[1], cooler_obj.bins()[:])
+        self.compartment_table = compartment_interpolate(cis_eigs, cooler_obj.bins()[:])
+        # Трек считается один раз: get_track вызывается на каждое окно
+        compartment_track = self.compartment_table['E1'].to_numpy()
+        if self.compartment_binarize:
+            compartment_track = np.where(compartment_track > 0, np.float64(1), np.float64(0))
+        self._track = compartment_track
 
     def get_feature_by_postition(
         self,
         start: int,
         end: int
     ):
-        compartment_track = self.compartment_table[start:end]['E1'].to_numpy()
-        if self.compartment_binarize:
-            discretize = np.vectorize(lambda x: np.float64(1) if x > 0 else np.float64(0))
-            compartment_track = discretize(compartment_track)
-        return compartment_track
+        return self.get_track()[start:end]
+
+    def get_track(self):
+        return self._track
 
     def to_dict(self):
         return dict(
@@ -0,0 +1,135 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import h5py
+import bioframe
+import cooltools
+from cooler import Cooler
+
+
+# Наборы данных cooler, от которых зависят производные треки
+_COOLER_DATASETS = [
+    'bins/chrom', 'bins/start', 'bins/end', 'bins/weight',
+    'pixels/bin1_id', 'pixels/bin2_id', 'pixels/count'
+]
+
+
+def _memoized_checksum(tmp_path: str, key: str, path: str, compute_fnc: callable):
+    # Контрольная сумма пересчитывается, только если файл изменился
+    stat = os.stat(path)
+    memo_path = f'{tmp_path}/checksums.json'
+    memo = dict()
+    if os.path.isfile(memo_path):
+        with open(memo_path, 'r') as inf:
+            memo = json.load(inf)
+    entry = memo.get(key)
+    if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+        return entry['checksum']
+    checksum = compute_fnc()
+    memo[key] = dict(size=stat.st_size, mtime=stat.st_mtime_ns, checksum=checksum)
+    with open(f'{memo_path}.tmp', 'w') as outf:
+        json.dump(memo, outf)
+    os.replace(f'{memo_path}.tmp', memo_path)
+    return checksum
+
+
+def cooler_checksum(clr: Cooler, tmp_path: str, chunk_size: int = 1 << 22):
+    def compute():
+        digest = hashlib.sha256()
+        with h5py.File(clr.filename, 'r') as inf:
+            group = inf[clr.root]
+            for name in _COOLER_DATASETS:
+                if name not in group:
+                    continue
+                dataset = group[name]
+                digest.update(name.encode())
+                for lo in range(0, len(dataset), chunk_size):
+                    digest.update(np.ascontiguousarray(dataset[lo:lo + chunk_size]).tobytes())
+        return digest.hexdigest()
+    return _memoized_checksum(tmp_path, f'{os.path.abspath(clr.filename)}::{clr.root}', clr.filename, compute)
+
+
+def file_checksum(path: str, tmp_path: str, chunk_size: int = 1 << 22):
+    def compute():
+        digest = hashlib.sha256()
+        with open(path, 'rb') as inf:
+            for chunk in iter(lambda: inf.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    return _memoized_checksum(tmp_path, os.path.abspath(path), path, compute)
+
+
+def content_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def save_frame(path: str, frame: pd.DataFrame):
+    columns = {f'c{pos}': frame[name].to_numpy() for pos, name in enumerate(frame.columns)}
+    for key, value in columns.items():
+        if value.dtype == object:
+            columns[key] = value.astype(str)
+    with open(f'{path}.tmp', 'wb') as outf:
+        np.savez(outf, __columns__=np.array([str(name) for name in frame.columns]), **columns)
+    os.replace(f'{path}.tmp', path)
+
+
+def load_frame(path: str):
+    with np.load(path) as inf:
+        names = list(inf['__columns__'])
+        return pd.DataFrame({name: inf[f'c{pos}'] for pos, name in enumerate(names)})
+
+
+def cached_frame(tmp_path: str, name: str, key: str, compute_fnc: callable):
+    # Производная таблица по хешу входных данных, формат npz вместо TSV
+    path = f'{tmp_path}/{name}_{key[:16]}.npz'
+    if os.path.isfile(path):
+        return load_frame(path)
+    frame = compute_fnc()
+    save_frame(path, frame)
+    return frame
+
+
+def _frac_gc_chrom(bins: pd.DataFrame, fasta_path: str):
+    genome = bioframe.load_fasta(fasta_path)
+    return bioframe.frac_gc(bins, genome)
+
+
+def frac_gc(bins: pd.DataFrame, fasta_path: str, n_workers: int = 1):
+    bins = bins[['chrom', 'start', 'end']]
+    chunks = [chunk for _, chunk in bins.groupby('chrom', sort=False, observed=True)]
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            parts = list(executor.map(_frac_gc_chrom, chunks, [fasta_path] * len(chunks)))
+    else:
+        parts = [_frac_gc_chrom(chunk, fasta_path) for chunk in chunks]
+    return pd.concat(parts).loc[bins.index].reset_index(drop=True)
+
+
+def _eigs_cis_chrom(cooler_uri: str, gc_cov: pd.DataFrame, view_df: pd.DataFrame, n_eigs: int):
+    return cooltools.eigs_cis(Cooler(cooler_uri), gc_cov, view_df=view_df, n_eigs=n_eigs)
+
+
+def eigs_cis(clr: Cooler, gc_cov: pd.DataFrame, n_eigs: int = 3, n_workers: int = 1):
+    # Собственные векторы считаются для каждой хромосомы независимо
+    cooler_uri = f'{clr.filename}::{clr.root}'
+    view_dfs = [
+        pd.DataFrame({'chrom': [chrom], 'start': [0], 'end': [size], 'name': [chrom]})
+        for chrom, size in zip(clr.chromnames, clr.chromsizes.values)
+    ]
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_eigs_cis_chrom, cooler_uri, gc_cov, view_df, n_eigs) for view_df in view_dfs]
+            parts = [future.result() for future in futures]
+    else:
+        parts = [_eigs_cis_chrom(cooler_uri, gc_cov, view_df, n_eigs) for view_df in view_dfs]
+    eigvals = pd.concat([part[0] for part in parts], ignore_index=True)
+    eigvecs = pd.concat([part[1] for part in parts]).reset_index(drop=True)
+    return eigvals, eigvecs
+
+
+def insulation(clr: Cooler, windows: list, n_workers: int = 1):
+    # Порог границ (Li) считается по всему геному, поэтому хромосомы параллелит сам cooltools
+    return cooltools.insulation(clr, windows, verbose=True, nproc=n_workers)
@@ -38,7 +38,10 @@ class FountainsFeature(Feature):
         start: int,
         end: int
     ):
-        return self.fountains_table[start:end]['FS'].to_numpy()
+        return self.get_track()[start:end]
+
+    def get_track(self):
+        return self.fountains_table['FS'].to_numpy()
 
     def to_dict(self):
         return dict(
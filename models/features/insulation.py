@@ -1,10 +1,9 @@
 from .base import Feature
 from cooler import Cooler
-from cooltools import insulation
 import os
-import pandas as pd
 import numpy as np
 from .utils import nan_interpolator
+from .derived import content_key, cooler_checksum, cached_frame, insulation
 
 
 class InsulationFeature(Feature):
@@ -21,29 +20,41 @@ class InsulationFeature(Feature):
         resolution: int,
         cooler_entity: Cooler,
         insulation_window: int,
-        transform: bool = False
+        transform: bool = False,
+        n_workers: int = 1  # Процессы для расчёта инсуляции по хромосомам
     ):
         self.insulation_window = insulation_window
         self.transform = transform
-        if not os.path.isfile(f'{self.base_path}/tmp/insulation_track_{resolution//1000}kb.csv'):
-            windows = [3*resolution, 5*resolution, 10*resolution, 25*resolution]
-            self.insulation_table = insulation(cooler_entity, windows, verbose=True)
-            self.insulation_table.to_csv(f'{self.base_path}/tmp/insulation_track_{resolution//1000}kb.csv', index=False, sep='\t')
-        else:
-            self.insulation_table = pd.read_csv(f'{self.base_path}/tmp/insulation_track_{resolution//1000}kb.csv', sep='\t')
+        tmp_path = f'{self.base_path}/tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+        windows = [3*resolution, 5*resolution, 10*resolution, 25*resolution]
+        key = content_key('insulation', cooler_checksum(cooler_entity, tmp_path), resolution, windows)
+        self.insulation_table = cached_frame(
+            tmp_path, 'insulation_track', key,
+            lambda: insulation(cooler_entity, windows, n_workers)
+        )
+        # Трек считается один раз: get_track вызывается на каждое окно
+        track = self.insulation_table[self.insulation_window].to_numpy()
+        if self.transform:
+            track = np.trunc(track.astype(np.float64))
+        self._track = track
 
     def get_feature_by_postition(
         self,
         start: int,
         end: int
     ):
-        local_track = self.insulation_table.iloc[start:end, :]
-        local_track = local_track[self.insulation_window]
-        if self.transform:
-            local_track = local_track.apply(lambda x: np.float64(int(x)))
-        local_track = local_track.to_numpy()
-        local_track = nan_interpolator(local_track)
-        return local_track
+        return self.transform_windows(self.get_track()[None, start:end])[0]
+
+    def get_track(self):
+        return self._track
+
+    def transform_windows(self, windows: np.array):
+        # Пропуски интерполируются внутри каждого окна, как и при поконном чтении
+        windows = np.array(windows, dtype=np.float64)
+        for row in np.flatnonzero(np.isnan(windows).any(axis=1)):
+            windows[row] = nan_interpolator(windows[row])
+        return windows
 
     def to_dict(self):
         return dict(
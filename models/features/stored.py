@@ -0,0 +1,46 @@
+import numpy as np
+from .base import Feature
+from .norms import NormTypes
+
+
+# Признак готового хранилища, восстановленный из meta.json: только описание memmap
+# и статистика нормировки. memmap открываются при первом обращении, поэтому после
+# сериализации каждый воркер открывает их сам
+class StoredFeature(Feature):
+    def __init__(self, meta: dict):
+        for key, value in meta.items():
+            setattr(self, key, value)
+        self.memmap_shape = tuple(meta['memmap_shape'])
+        self.dtype = meta.get('dtype', Feature.dtype)
+        self.normalized = tuple(meta.get('normalized', ()))
+        self._mode = 'r'
+        self._memmap = None
+        self._norm_memmaps = dict()
+
+    def get_feature_by_postition(self, start: int, end: int):
+        raise ValueError(f'Feature {self.name} was loaded from storage and has no source track')
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.update(_memmap=None, _norm_memmaps=dict())
+        return state
+
+    @property
+    def memmap(self):
+        if self._memmap is None:
+            self._memmap = np.memmap(self.path, shape=self.memmap_shape, mode=self._mode, dtype=self.dtype)
+        return self._memmap
+
+    def load_memmap(self, mode: str = 'r+'):
+        self._mode = mode
+        self._memmap = None
+        self._norm_memmaps = dict()
+
+    def norm_memmap(self, norm_type: NormTypes):
+        if norm_type.name not in self.normalized:
+            return None
+        norm_memmap = self._norm_memmaps.get(norm_type)
+        if norm_memmap is None:
+            norm_memmap = np.memmap(self.norm_path(norm_type), shape=self.memmap_shape, mode=self._mode, dtype=self.dtype)
+            self._norm_memmaps[norm_type] = norm_memmap
+        return norm_memmap
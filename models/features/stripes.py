@@ -25,7 +25,10 @@ class StripesFeature(Feature):
         start: int,
         end: int
     ):
-        return self.stripes_table[start:end]['cross_score'].to_numpy()
+        return self.get_track()[start:end]
+
+    def get_track(self):
+        return self.stripes_table['cross_score'].to_numpy()
 
     def to_dict(self):
         return dict(
@@ -0,0 +1,195 @@
+import numpy as np
+import json
+import os
+from typing import List
+from .features.norms import NormTypes
+from .integrity import VerifyTypes, FAST_HASH, sha256_digest, fast_digest
+from .layout import MapLayout
+
+DIGEST_SIZE = 32
+
+
+def index_dtype(feature_names: List[str], fast: bool = True):
+    # Одна запись на окно: позиции и sha256 (+ быстрый хеш) карты и каждого признака
+    fields = [('idx', '<i8'), ('start_position', '<i8'), ('end_position', '<i8')]
+    for name in ['map', *feature_names]:
+        fields.append((name, 'u1', (DIGEST_SIZE, )))
+        if fast:
+            fields.append((f'{name}_fast', '<u8'))
+    return np.dtype(fields)
+
+
+class DiscRow():
+    __slots__ = ('records', 'pos')
+
+    def __init__(self, records: np.ndarray, pos: int):
+        self.records = records
+        self.pos = pos
+
+    @property
+    def idx(self):
+        return int(self.records['idx'][self.pos])
+
+    @property
+    def start_position(self):
+        return int(self.records['start_position'][self.pos])
+
+    @property
+    def end_position(self):
+        return int(self.records['end_position'][self.pos])
+
+    def set_position(self, idx, start_position, end_position):
+        self.records['idx'][self.pos] = idx
+        self.records['start_position'][self.pos] = start_position
+        self.records['end_position'][self.pos] = end_position
+
+    def set_feature(self, name, val, fast_val=None):
+        self.records[name][self.pos] = np.frombuffer(val, dtype=np.uint8)
+        if fast_val is not None:
+            self.records[f'{name}_fast'][self.pos] = fast_val
+
+    def set_map(self, map):
+        self.set_feature('map', sha256_digest(map), fast_digest(map))
+
+    def has(self, name: str):
+        return name in self.records.dtype.names
+
+    def digest(self, name: str):
+        return self.records[name][self.pos].tobytes()
+
+    def to_dict(self):
+        out = dict(
+            idx=self.idx,
+            start_position=self.start_position,
+            end_position=self.end_position
+        )
+        fast = dict()
+        for name in self.records.dtype.names:
+            if self.records.dtype[name].shape == (DIGEST_SIZE, ):
+                out[name] = self.digest(name).hex()
+                if self.has(f'{name}_fast'):
+                    fast[name] = int(self.records[f'{name}_fast'][self.pos])
+        if fast:
+            out['fast'] = fast
+        return out
+
+    @classmethod
+    def from_json(cls, json_name):
+        return DiscIndex.from_json(json_name)
+
+    def check(self, name: str, value: np.array, verify: VerifyTypes, fast_hash: str = FAST_HASH):
+        match verify:
+            case VerifyTypes.FULL:
+                return sha256_digest(value) == self.digest(name)
+            case VerifyTypes.FAST:
+                if not self.has(f'{name}_fast'):
+                    raise ValueError('Storage has no fast hashes, regenerate it or use another verify type')
+                return fast_digest(value, fast_hash) == int(self.records[f'{name}_fast'][self.pos])
+            case VerifyTypes.NONE:
+                return True
+            case _:
+                raise ValueError(f'Unknown verify type {verify}')
+
+    def get_row(
+        self,
+        idx: int,
+        map_array: np.memmap,
+        norm_type: NormTypes,
+        *features,
+        verify: VerifyTypes = VerifyTypes.FULL,
+        fast_hash: str = FAST_HASH,
+        layout: MapLayout = None
+    ):
+        out = dict()
+        if self.idx != idx:
+            raise ValueError('Wrong idx')
+        out['idx'] = idx
+        map = np.ascontiguousarray(map_array[idx])
+        if not self.check('map', map, verify, fast_hash):
+            raise ValueError('Something wrong with map array')
+        if layout is not None:
+            map = layout.unpack(map)
+        out['map'] = map
+        out['start_position'] = self.start_position
+        out['end_position'] = self.end_position
+
+        for feature in features:
+            feature_name = feature.name
+            if not self.has(feature_name):
+                raise ValueError(f'No such feature {feature_name}')
+            norm_memmap = feature.norm_memmap(norm_type)
+            if norm_memmap is None or verify != VerifyTypes.NONE:
+                feature_val = np.ascontiguousarray(feature.get_feature_by_index(idx))
+                if not self.check(feature_name, feature_val, verify, fast_hash):
+                    raise ValueError(f'Wrong feature {feature_name}')
+            # Нормированная копия не хешируется: при проверке значения считаются из проверенной строки
+            if norm_memmap is None:
+                feature_val = feature.norm(feature_val, norm_type)
+            elif verify != VerifyTypes.NONE:
+                feature_val = feature.norm_copy(feature_val, norm_type)
+            else:
+                feature_val = np.array(norm_memmap[idx])
+            out[feature_name] = feature_val
+        return out
+
+
+# Индекс окон как структурированный numpy-массив, на диске index.npy открывается через mmap
+class DiscIndex():
+    def __init__(self, records: np.ndarray):
+        self.records = records
+
+    @classmethod
+    def empty(cls, length: int, feature_names: List[str]):
+        return cls(np.zeros(length, dtype=index_dtype(feature_names)))
+
+    @classmethod
+    def load(cls, path: str):
+        return cls(np.load(path, mmap_mode='r'))
+
+    @classmethod
+    def from_json(cls, json_name: str):
+        # Старый формат index.json: словарь DiscRow.__dict__ с hex-хешами
+        with open(json_name, 'r') as inf:
+            files = json.load(inf)
+        rows = [files[key] for key in sorted(files, key=int)]
+        service = {'idx', 'start_position', 'end_position', 'map', 'fast'}
+        feature_names = [key for key in rows[0] if key not in service] if rows else []
+        fast = bool(rows) and 'fast' in rows[0]
+        index = cls(np.zeros(len(rows), dtype=index_dtype(feature_names, fast)))
+        for pos, val in enumerate(rows):
+            row = index[pos]
+            row.set_position(val['idx'], val['start_position'], val['end_position'])
+            for name in ['map', *feature_names]:
+                row.set_feature(name, bytes.fromhex(val[name]), val['fast'][name] if fast else None)
+        return index
+
+    def save(self, path: str):
+        # Через временный файл: старый index.npy может быть открыт через mmap
+        with open(f'{path}.tmp', 'wb') as outf:
+            np.save(outf, self.records)
+        os.replace(f'{path}.tmp', path)
+
+    def with_feature(self, name: str):
+        # Копия индекса с (пустыми) колонками нового признака
+        fast = 'map_fast' in self.records.dtype.names
+        feature_names = [
+            key for key in self.records.dtype.names
+            if self.records.dtype[key].shape == (DIGEST_SIZE, ) and key not in ('map', name)
+        ]
+        records = np.zeros(len(self.records), dtype=index_dtype([*feature_names, name], fast))
+        for key in self.records.dtype.names:
+            if key in records.dtype.names and key not in (name, f'{name}_fast'):
+                records[key] = self.records[key]
+        return DiscIndex(records)
+
+    def column(self, name: str):
+        return self.records[name]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, idx):
+        idx = int(idx)
+        if idx < 0 or idx >= len(self.records):
+            raise KeyError(idx)
+        return DiscRow(self.records, idx)
@@ -0,0 +1,34 @@
+import hashlib
+import zlib
+from enum import Enum
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+class VerifyTypes(Enum):
+    FULL = 0  # sha256 на каждом чтении
+    NONE = 1  # без проверки
+    SAMPLED = 2  # sha256 на каждом N-ом чтении
+    FAST = 3  # некриптографический хеш на каждом чтении
+
+
+FAST_HASH = 'xxh3_64' if xxhash is not None else 'crc32'
+
+
+def sha256_digest(value):
+    return hashlib.sha256(value).digest()
+
+
+def fast_digest(value, algorithm: str = FAST_HASH):
+    match algorithm:
+        case 'xxh3_64':
+            if xxhash is None:
+                raise ImportError('xxhash is required to verify this storage in fast mode')
+            return xxhash.xxh3_64_intdigest(value)
+        case 'crc32':
+            return zlib.crc32(value)
+        case _:
+            raise ValueError(f'Unknown fast hash {algorithm}')
@@ -0,0 +1,92 @@
+import numpy as np
+from functools import lru_cache
+from .chunked import ChunkedArray
+
+
+@lru_cache(maxsize=None)
+def _triangle_indices(window_size: int):
+    return np.triu_indices(window_size), np.tril_indices(window_size, -1)
+
+
+# Формат хранения карт на диске: тип данных и упаковка верхнего треугольника
+class MapLayout():
+    def __init__(
+        self,
+        window_size: int,
+        dtype=np.float64,
+        packed: bool = False,
+        fourier: bool = False,  # Дополнительно хранить сдвинутый спектр карты (complex64)
+        compression: str = None,  # Кодек сжатия карт по окнам; None - несжатый memmap
+        compression_level: int = None,
+        cache_size: int = None  # LRU распакованных окон сжатых карт; None - по объёму (chunked.CACHE_BYTES)
+    ):
+        self.window_size = window_size
+        self.dtype = np.dtype(dtype).name
+        self.packed = packed
+        self.fourier = fourier
+        self.compression = compression
+        self.compression_level = compression_level
+        self.cache_size = cache_size
+
+    @classmethod
+    def from_meta(cls, meta: dict):
+        return cls(
+            meta['window_size'],
+            meta.get('dtype', 'float64'),
+            meta.get('packed', False),
+            meta.get('fourier', False),
+            meta.get('compression'),
+            meta.get('compression_level'),
+            meta.get('cache_size')
+        )
+
+    def to_dict(self):
+        return dict(
+            dtype=self.dtype,
+            packed=self.packed,
+            fourier=self.fourier,
+            compression=self.compression,
+            compression_level=self.compression_level,
+            cache_size=self.cache_size
+        )
+
+    @property
+    def row_shape(self):
+        if self.packed:
+            return (self.window_size * (self.window_size + 1) // 2, )
+        return (self.window_size, self.window_size)
+
+    @property
+    def maps_name(self):
+        return '.maps.npy' if self.compression is None else '.maps.chunks'
+
+    def open_memmap(self, path: str, length: int, mode: str = 'r'):
+        if self.compression is not None:
+            return ChunkedArray(
+                path, length, self.row_shape, self.dtype, self.compression, self.compression_level, mode, self.cache_size
+            )
+        return np.memmap(path, mode=mode, shape=(length, *self.row_shape), dtype=self.dtype)
+
+    def open_fourier_memmap(self, path: str, length: int, mode: str = 'r'):
+        return np.memmap(path, mode=mode, shape=(length, self.window_size, self.window_size), dtype=np.complex64)
+
+    def spectrum(self, stored: np.array):
+        # Тот же спектр, что fft2d из models.dataset считает по float32-карте
+        item = self.unpack(stored).astype(np.float32)
+        return np.fft.fftshift(np.fft.fft2(item), axes=(-2, -1)).astype(np.complex64)
+
+    def pack(self, item: np.array):
+        if self.packed:
+            upper, _ = _triangle_indices(self.window_size)
+            item = item[upper]
+        return np.ascontiguousarray(item, dtype=self.dtype)
+
+    def unpack(self, stored: np.array):
+        # Принимает одну упакованную карту или батч с ведущими измерениями
+        if not self.packed:
+            return stored
+        upper, lower = _triangle_indices(self.window_size)
+        item = np.empty((*stored.shape[:-1], self.window_size, self.window_size), dtype=stored.dtype)
+        item[..., upper[0], upper[1]] = stored
+        item[..., lower[0], lower[1]] = item[..., lower[1], lower[0]]
+        return item
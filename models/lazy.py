@@ -0,0 +1,193 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import numpy as np
+from .datastorage import DiscStorage, _window_borders
+from .band import BandCache
+from .expected import ExpectedTypes
+from .features.base import Feature
+from .features.norms import NormTypes
+from .index import DiscIndex
+from .regions import WindowIndex
+from .stats import RunningStats
+from .utils import hic_transform
+
+
+# Хранилище без предварительной генерации: окна считаются из cooler при первом обращении
+# теми же hic_transform и отбором по весам, что и в generate_dataset. Посчитанные окна
+# можно в фоне дописывать в обычное хранилище, finalize превращает его в DiscStorage
+class LazyStorage():
+    def __init__(
+        self,
+        storage_path: str,
+        cooler_name: str,
+        resolution: int,
+        window_size: int,
+        features: List[Feature],
+        expected: ExpectedTypes = ExpectedTypes.WINDOW,
+        cache_windows: int = None,  # Сколько готовых окон держать в LRU; None - на 256 МБ
+        max_bands: int = None,  # Сколько плотных блоков cooler держать в LRU; None - по объёму (BandCache)
+        persist: bool = False  # Дописывать посчитанные окна в хранилище в фоновом потоке
+    ):
+        self.storage = DiscStorage(storage_path, cooler_name)
+        if persist and os.path.exists(f'{self.storage.storage_path}/meta.json'):
+            raise FileExistsError('Storage is already generated, open it with DiscStorage')
+        self.windows = self.storage._setup_generation(resolution, window_size, features, expected, np.float64, False, False)
+        self.window_size = window_size
+        self.features = features
+        self.layout = self.storage.layout
+        self.clr = self.storage.clr
+        self.start_position = (window_size * self.windows // 2).astype(np.int64)
+        self.expected_table = None
+        if expected == ExpectedTypes.CHROMOSOME:
+            self.expected_table = self.storage.load_expected(resolution, 3 * window_size)
+        if cache_windows is None:
+            cache_windows = max(1, 256 * 2 ** 20 // (window_size * window_size * np.dtype(np.float64).itemsize))
+        self.cache_windows = cache_windows
+        self.max_bands = max_bands
+        self._bands = None
+        self._cache = OrderedDict()
+        self._metadata = None
+        self._window_index = None
+        self._feature_stats()
+
+        self._persist = persist
+        self._executor = None
+        if persist:
+            self._start_persist()
+
+    def _feature_stats(self, chunk_size: int = 4096):
+        # Статистика для нормировки по всем принятым окнам, без чтения карт
+        for feature in self.features:
+            stats = RunningStats()
+            for lo in range(0, len(self), chunk_size):
+                stats.update(feature.get_windows(self.start_position[lo:lo + chunk_size], self.window_size))
+            feature.min, feature.max, feature.mean, feature.std = stats.min, stats.max, stats.mean, stats.std
+
+    def _start_persist(self):
+        storage = self.storage
+        length = len(self)
+        storage.map_stats = RunningStats()
+        storage.map_array = self.layout.open_memmap(f'{storage.storage_path}/{storage._meta["maps"]}', length, mode='w+')
+        storage.fourier_array = None
+        for feature in self.features:
+            feature.create_memmap(self.window_size, length, True, np.float64)
+        storage._index = DiscIndex.empty(length, [feature.name for feature in self.features])
+        self._computed = np.zeros(length, dtype=bool)
+        # Окна, отданные на запись, но ещё не записанные: после вытеснения из LRU
+        # они берутся отсюда, а не считаются и отправляются на запись повторно
+        self._pending = dict()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def __getstate__(self):
+        # Воркеры DataLoader только считают окна, дописывает их основной процесс
+        state = self.__dict__.copy()
+        state.update(storage=None, _executor=None, _persist=False, _bands=None, _cache=OrderedDict())
+        state.pop('_computed', None)
+        state.pop('_pending', None)
+        return state
+
+    def __len__(self):
+        return len(self.windows)
+
+    def _compute(self, pos: int):
+        window_size = self.window_size
+        left_border, right_border = _window_borders(self.windows[pos], window_size)
+        if self._bands is None:
+            self._bands = BandCache(self.clr, 3 * window_size, max_bands=self.max_bands)
+        item = self._bands.fetch(left_border - window_size, right_border + window_size)
+        expected = None
+        if self.expected_table is not None:
+            expected = self.expected_table.window(left_border - window_size, right_border + window_size)
+        verdict, item = hic_transform(item, window_size, expected)
+        if not verdict:
+            raise ValueError(f'Window {self.windows[pos]} was accepted by pre-pass but rejected by hic_transform')
+        return item
+
+    def _write(self, pos: int, item: np.array):
+        storage = self.storage
+        left_border, right_border = _window_borders(self.windows[pos], self.window_size)
+        packed = self.layout.pack(item)
+        storage.map_array[pos] = packed
+        row = storage._index[pos]
+        row.set_position(pos, left_border, right_border)
+        row.set_map(packed)
+        storage.map_stats.update(item)
+        # Сначала отметка о записи, затем удаление из _pending: _window проверяет их в обратном порядке
+        self._computed[pos] = True
+        self._pending.pop(pos, None)
+
+    def _window(self, pos: int):
+        item = self._cache.get(pos)
+        if item is not None:
+            self._cache.move_to_end(pos)
+            return item
+        pending = self._pending.get(pos) if self._persist else None
+        if pending is not None:
+            item = pending
+        elif self._persist and self._computed[pos]:
+            item = np.array(self.layout.unpack(self.storage.map_array[pos]))
+        else:
+            item = self._compute(pos)
+            if self._persist:
+                self._pending[pos] = item
+                self._executor.submit(self._write, pos, item)
+        self._cache[pos] = item
+        if len(self._cache) > self.cache_windows:
+            self._cache.popitem(last=False)
+        return item
+
+    def __getitem__(self, idx):
+        norm_type = NormTypes.NONE
+        if isinstance(idx, tuple):
+            idx, norm_type = idx
+        if idx < 0 or idx >= len(self):
+            raise KeyError(idx)
+        out = dict()
+        out['idx'] = idx
+        out['map'] = self._window(idx)
+        out['start_position'] = self.start_position[idx]
+        out['end_position'] = self.start_position[idx] + self.window_size
+        for feature in self.features:
+            value = feature.get_windows(self.start_position[idx:idx + 1], self.window_size)[0]
+            out[feature.name] = feature.norm(np.asarray(value, dtype=np.float64), norm_type)
+        return out
+
+    def get_batch(self, indices, norm_type: NormTypes = NormTypes.NONE, with_map: bool = True):
+        indices = np.asarray(indices, dtype=np.int64)
+        out = dict()
+        out['idx'] = indices
+        if with_map:
+            out['map'] = np.stack([self._window(int(idx)) for idx in indices])
+        out['start_position'] = self.start_position[indices]
+        out['end_position'] = self.start_position[indices] + self.window_size
+        for feature in self.features:
+            value = feature.get_windows(self.start_position[indices], self.window_size)
+            out[feature.name] = feature.norm(np.asarray(value, dtype=np.float64), norm_type)
+        return out
+
+    def get_fourier(self, indices):
+        raise ValueError('Lazy storage has no stored map spectra, use FourierModes.SAMPLE or BATCH')
+
+    def window_index(self):
+        if self._window_index is None:
+            self._window_index = WindowIndex.from_cooler(self.clr, self.start_position, self.start_position + self.window_size)
+        return self._window_index
+
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = self.window_index().windows_to_regions(np.arange(len(self)))
+        return self._metadata
+
+    def finalize(self, normalized: List[NormTypes] = ()):
+        # Досчитывает оставшиеся окна и записывает хранилище целиком
+        if not self._persist:
+            raise ValueError('Lazy storage was created without persist')
+        self._executor.shutdown(wait=True)
+        for pos in np.flatnonzero(~self._computed):
+            item = self._cache.get(pos)
+            self._write(pos, self._compute(pos) if item is None else item)
+        self.storage._finish_generation(len(self), normalized)
+        self._persist = False
+        return self.storage
@@ -0,0 +1,153 @@
+import csv
+import json
+import time
+import numpy as np
+
+
+# Границы корзин гистограммы длительностей: от 1 мкс до ~2 мин, шаг x2
+HISTOGRAM_EDGES = 1e-6 * 2.0 ** np.arange(28)
+
+
+class _NullStage():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+# Метрики по умолчанию: ничего не записывают
+class Metrics():
+    enabled: bool = False
+
+    def stage(self, name: str):
+        return _NULL_STAGE
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def spawn(self):
+        # Пустой экземпляр того же типа для воркера
+        return self
+
+    def merge(self, other: 'Metrics'):
+        return self
+
+    def summary(self):
+        return dict()
+
+
+NULL_METRICS = Metrics()
+
+
+class _Stage():
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics: 'StageMetrics', name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StageMetrics(Metrics):
+    enabled: bool = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = dict()  # имя -> [число, сумма, min, max, гистограмма]
+        self.counters = dict()
+
+    def stage(self, name: str):
+        return _Stage(self, name)
+
+    def observe(self, name: str, seconds: float):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = [0, 0.0, np.inf, 0.0, np.zeros(len(HISTOGRAM_EDGES) + 1, dtype=np.int64)]
+            self.stages[name] = stage
+        stage[0] += 1
+        stage[1] += seconds
+        stage[2] = min(stage[2], seconds)
+        stage[3] = max(stage[3], seconds)
+        stage[4][np.searchsorted(HISTOGRAM_EDGES, seconds)] += 1
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def spawn(self):
+        return StageMetrics()
+
+    def merge(self, other: Metrics):
+        if not other.enabled:
+            return self
+        for name, (count, total, minimum, maximum, histogram) in other.stages.items():
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = [count, total, minimum, maximum, histogram.copy()]
+                continue
+            stage[0] += count
+            stage[1] += total
+            stage[2] = min(stage[2], minimum)
+            stage[3] = max(stage[3], maximum)
+            stage[4] += histogram
+        for name, value in other.counters.items():
+            self.count(name, value)
+        return self
+
+    def _quantile(self, histogram: np.array, q: float):
+        # Верхняя граница корзины, в которую попал квантиль
+        position = np.searchsorted(np.cumsum(histogram), q * histogram.sum())
+        return float(HISTOGRAM_EDGES[min(position, len(HISTOGRAM_EDGES) - 1)])
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        stages = dict()
+        for name, (count, total, minimum, maximum, histogram) in self.stages.items():
+            stages[name] = dict(
+                count=count,
+                total=total,
+                mean=total / count,
+                min=minimum,
+                max=maximum,
+                p50=self._quantile(histogram, 0.5),
+                p99=self._quantile(histogram, 0.99)
+            )
+        return dict(
+            elapsed=elapsed,
+            stages=stages,
+            counters=dict(self.counters),
+            throughput={name: value / elapsed for name, value in self.counters.items()}
+        )
+
+    def log_line(self):
+        summary = self.summary()
+        stages = ' '.join(f'{name}={stage["total"]:.3f}s' for name, stage in sorted(summary['stages'].items()))
+        counters = ' '.join(f'{name}={value}' for name, value in sorted(summary['counters'].items()))
+        return f'[metrics] elapsed={summary["elapsed"]:.3f}s {stages} {counters}'
+
+    def save_json(self, path: str):
+        with open(path, 'w') as outf:
+            json.dump(self.summary(), outf, indent=2)
+
+    def save_csv(self, path: str):
+        summary = self.summary()
+        with open(path, 'w', newline='') as outf:
+            writer = csv.writer(outf)
+            writer.writerow(['kind', 'name', 'count', 'total', 'mean', 'min', 'max', 'p50', 'p99', 'per_second'])
+            for name, stage in sorted(summary['stages'].items()):
+                writer.writerow([
+                    'stage', name, stage['count'], stage['total'], stage['mean'],
+                    stage['min'], stage['max'], stage['p50'], stage['p99'], ''
+                ])
+            for name, value in sorted(summary['counters'].items()):
+                writer.writerow(['counter', name, value, '', '', '', '', '', '', summary['throughput'][name]])
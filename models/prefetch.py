@@ -0,0 +1,160 @@
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+from .access import AccessModes, madvise
+from .features.norms import NormTypes
+from .metrics import Metrics, NULL_METRICS
+
+
+# Файл memmap для чтения мимо numpy: os.pread отпускает GIL, пока ждёт диск
+class _RowFile():
+    def __init__(self, array: np.memmap):
+        self.fd = os.open(array.filename, os.O_RDONLY)
+        self.offset = array.offset
+        self.row_nbytes = array.strides[0]
+
+    def advise(self, idx: int):
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(self.fd, self.offset + idx * self.row_nbytes, self.row_nbytes, os.POSIX_FADV_WILLNEED)
+
+    def read(self, idx: int):
+        os.pread(self.fd, self.row_nbytes, self.offset + idx * self.row_nbytes)
+
+    def close(self):
+        os.close(self.fd)
+
+
+# Подгрузка страниц хранилища перед чтением: сэмплер сообщает следующие индексы,
+# ядру уходит POSIX_FADV_WILLNEED, а фоновые потоки читают строки файлов, поднимая их
+# в page cache. Кэш страниц общий, поэтому это ускоряет и чтения в воркерах DataLoader.
+# Режим доступа (madvise) задаётся отображению, поэтому он передаётся самому хранилищу
+class Prefetcher():
+    def __init__(
+        self,
+        storage,
+        norm_type: NormTypes = NormTypes.NONE,  # Какие нормированные копии признаков подгружать
+        mode: AccessModes = AccessModes.RANDOM,
+        n_threads: int = 2,  # Потоки фонового чтения; 0 - только подсказки ядру
+        max_pending: int = 4096,  # Сколько ещё не прочитанных индексов помнить
+        metrics: Metrics = NULL_METRICS
+    ):
+        self.storage = storage
+        self.metrics = metrics
+        self.max_pending = max_pending
+        # Сжатые карты читаются через свой кэш и не подгружаются
+        self.arrays = [storage.map_array] if isinstance(storage.map_array, np.memmap) else []
+        for feature in storage.features:
+            self.arrays.append(feature.memmap)
+            norm_memmap = feature.norm_memmap(norm_type)
+            if norm_memmap is not None:
+                self.arrays.append(norm_memmap)
+        self._files = [_RowFile(array) for array in self.arrays]
+        self._pending = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=n_threads) if n_threads > 0 else None
+        self.ready = 0
+        self.late = 0
+        self.issued = 0
+        self.advise(mode)
+
+    def advise(self, mode: AccessModes):
+        # StorageReader запоминает режим и применяет его в load_index каждого воркера
+        self.mode = mode
+        if hasattr(self.storage, 'advise'):
+            self.storage.advise(mode)
+        else:
+            for array in self.arrays:
+                madvise(array, mode)
+
+    def _read(self, idx: int):
+        for row_file in self._files:
+            row_file.read(idx)
+
+    def hint(self, indices):
+        # Индексы, которые скоро будут прочитаны
+        issued = self.issued
+        for idx in np.asarray(indices, dtype=np.int64).ravel():
+            idx = int(idx)
+            if idx in self._pending:
+                continue
+            for row_file in self._files:
+                row_file.advise(idx)
+            self._pending[idx] = None if self._executor is None else self._executor.submit(self._read, idx)
+            self.issued += 1
+            if len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+        self.metrics.count('prefetch_issued', self.issued - issued)
+
+    def consume(self, idx: int):
+        # Вызывается, когда сэмплер отдаёт индекс DataLoader: ready - фоновое чтение
+        # завершилось до этого момента (без потоков - индекс был подсказан заранее).
+        # DataLoader забирает индексы на prefetch_factor * num_workers батчей раньше
+        # самого чтения, так что это не доля чтений из тёплого page cache
+        future = self._pending.pop(int(idx), False)
+        ready = future is None or (future is not False and future.done())
+        if ready:
+            self.ready += 1
+            self.metrics.count('prefetch_ready_at_dispatch')
+        else:
+            self.late += 1
+            self.metrics.count('prefetch_late_at_dispatch')
+        return ready
+
+    def stats(self):
+        total = self.ready + self.late
+        return dict(
+            issued=self.issued,
+            ready_at_dispatch=self.ready,
+            late_at_dispatch=self.late,
+            ready_rate=self.ready / total if total else 0.0,
+            pending=len(self._pending)
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._pending.clear()
+        for row_file in self._files:
+            row_file.close()
+        self._files = []
+
+
+# Обёртка над сэмплером DataLoader: заглядывает на depth индексов вперёд и передаёт
+# их в Prefetcher. Работает и с сэмплерами батчей (BlockBatchSampler)
+class PrefetchSampler(torch.utils.data.Sampler):
+    def __init__(
+        self,
+        sampler,
+        prefetcher: Prefetcher,
+        dataset=None,  # HiCMapDataset: индексы датасета переводятся в индексы хранилища
+        depth: int = 64  # На сколько элементов сэмплера заглядывать вперёд
+    ):
+        self.sampler = sampler
+        self.prefetcher = prefetcher
+        self.dataset = dataset
+        self.depth = depth
+
+    def _storage_indices(self, item):
+        indices = np.asarray(item, dtype=np.int64).ravel()
+        if self.dataset is not None:
+            indices = self.dataset.new_index[indices]
+        return indices
+
+    def __iter__(self):
+        window = deque()
+        for item in self.sampler:
+            window.append(item)
+            self.prefetcher.hint(self._storage_indices(item))
+            if len(window) > self.depth:
+                yield self._consume(window.popleft())
+        for item in window:
+            yield self._consume(item)
+
+    def _consume(self, item):
+        for idx in self._storage_indices(item):
+            self.prefetcher.consume(idx)
+        return item
+
+    def __len__(self):
+        return len(self.sampler)
@@ -0,0 +1,263 @@
+import os
+import json
+import numpy as np
+from .access import AccessModes, madvise
+from .features.norms import NormTypes, empty_norm, minmax_norm, z_norm
+from .features.stored import StoredFeature
+from .integrity import VerifyTypes, FAST_HASH
+from .layout import MapLayout
+from .index import DiscIndex
+from .metrics import Metrics, NULL_METRICS
+from .regions import WindowIndex
+
+
+def _read_rows(array: np.array, indices: np.array):
+    # Читает отсортированные индексы, объединяя подряд идущие в один срез
+    if len(indices) == 0:
+        return np.empty((0, *array.shape[1:]), dtype=array.dtype)
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    starts = indices[np.r_[0, breaks]]
+    stops = indices[np.r_[breaks - 1, len(indices) - 1]] + 1
+    return np.concatenate([array[start:stop] for start, stop in zip(starts, stops)])
+
+
+# Чтение готового хранилища: нужен только numpy. Признаки восстанавливаются из meta.json,
+# cooler открывается только для описания окон (metadata, clr)
+class StorageReader():
+
+    def __init__(
+        self,
+        storage_path: str,
+        cooler_name: str = None,  # Нужен только для metadata и clr
+        verify: VerifyTypes = VerifyTypes.FULL,  # Проверка хешей при чтении
+        verify_every: int = 100,  # Для VerifyTypes.SAMPLED: проверять каждое N-ое чтение
+        metrics: Metrics = NULL_METRICS,  # Сбор времени по стадиям и счётчиков
+        access_mode: AccessModes = None  # madvise для memmap; применяется в load_index каждого воркера
+    ):
+        self.storage_path = storage_path.rstrip('/')
+        self.cooler_name = cooler_name
+        self.verify_type = verify
+        self.verify_every = verify_every
+        self.metrics = metrics
+        self.access_mode = access_mode
+        self._reads = 0
+        if not os.path.exists(self.storage_path):
+            raise FileNotFoundError('Storage directory did not exists')
+        self._load_meta()
+
+    def _load_meta(self):
+        if os.path.exists(self.storage_path+'/meta.json'):
+            with open(self.storage_path+'/meta.json', 'r') as inf:
+                self._meta = json.load(inf)
+        else:
+            self._meta = dict()
+        self._metadata = None
+        self._window_index = None
+        self._clr = None
+        self._loaded = False
+
+    def __getstate__(self):
+        # memmap и индекс не копируются: воркер открывает их заново, cooler и pandas - только если нужны
+        state = self.__dict__.copy()
+        state.update(_clr=None, _metadata=None, _window_index=None)
+        if self._loaded:
+            for key in ['map_array', 'fourier_array', 'features', '_index']:
+                state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._loaded:
+            self.load_index()
+
+    @property
+    def clr(self):
+        if self._clr is None:
+            if self.cooler_name is None:
+                raise ValueError('Storage was opened without cooler name')
+            import cooler
+            self._clr = cooler.Cooler(f'{self.storage_path}/{self.cooler_name}::resolutions/{self._meta["resolution"]}')
+        return self._clr
+
+    @clr.setter
+    def clr(self, value):
+        self._clr = value
+
+    def load_index(self):
+        self.layout = MapLayout.from_meta(self._meta)
+        self.map_array = self.layout.open_memmap(f'{self.storage_path}/{self._meta["maps"]}', self._meta['memmap_shape'][0])
+        self.fourier_array = None
+        if self.layout.fourier:
+            self.fourier_array = self.layout.open_fourier_memmap(f'{self.storage_path}/{self._meta["maps_fft"]}', self._meta['memmap_shape'][0])
+        self.features = [StoredFeature(meta) for meta in self._meta['features']]
+        for feature in self.features:
+            # Путь признака записан относительно каталога запуска генерации
+            local_path = f'{self.storage_path}/{os.path.basename(feature.path)}'
+            if not os.path.exists(feature.path) and os.path.exists(local_path):
+                feature.path = local_path
+            feature.load_memmap(mode='r')
+        if os.path.exists(f'{self.storage_path}/index.npy'):
+            self._index = DiscIndex.load(f'{self.storage_path}/index.npy')
+        else:
+            self._index = DiscIndex.from_json(f'{self.storage_path}/index.json')
+        if self.verify_type == VerifyTypes.FAST and 'fast_hash' not in self._meta:
+            raise ValueError('Storage has no fast hashes, regenerate it or use another verify type')
+        self._loaded = True
+        if self.access_mode is not None:
+            self.advise(self.access_mode)
+
+    def advise(self, mode: AccessModes):
+        # Режим запоминается и передаётся воркерам вместе с читателем: они переоткрывают
+        # memmap в load_index и применяют его к своим отображениям
+        self.access_mode = mode
+        arrays = [self.map_array, self.fourier_array]
+        for feature in self.features:
+            arrays.append(feature.memmap)
+            arrays.extend(feature.norm_memmap(NormTypes[name]) for name in feature.normalized)
+        for array in arrays:
+            if isinstance(array, np.memmap):
+                madvise(array, mode)
+
+    def _read_verify_type(self):
+        if self.verify_type != VerifyTypes.SAMPLED:
+            return self.verify_type
+        self._reads += 1
+        if self._reads % self.verify_every == 0:
+            return VerifyTypes.FULL
+        return VerifyTypes.NONE
+
+    def __len__(self):
+        return self._meta['length']
+
+    @property
+    def window_size(self):
+        return self._meta['window_size']
+
+    def __getitem__(self, idx):
+        norm_type = NormTypes.NONE
+        if isinstance(idx, tuple):
+            idx, norm_type = idx
+        verify = self._read_verify_type()
+        with self.metrics.stage('read_row'):
+            out = self._index[idx].get_row(
+                idx,
+                self.map_array,
+                norm_type,
+                *self.features,
+                verify=verify,
+                fast_hash=self._meta.get('fast_hash', FAST_HASH),
+                layout=self.layout
+            )
+        if self.metrics.enabled:
+            self.metrics.count('samples_read')
+            self.metrics.count('bytes_read', sum(value.nbytes for value in out.values() if isinstance(value, np.ndarray)))
+            if verify != VerifyTypes.NONE:
+                self.metrics.count('hash_checks', 1 + len(self.features))
+        return out
+
+    def get_batch(
+        self,
+        indices,
+        norm_type: NormTypes = NormTypes.NONE,
+        with_map: bool = True  # False - только признаки и позиции, карты не читаются
+    ):
+        # Читаем окна в порядке хранения, затем возвращаем порядок запроса
+        indices = np.asarray(indices, dtype=np.int64)
+        unique_indices, restore = np.unique(indices, return_inverse=True)
+
+        rows = [self._index[idx] for idx in unique_indices]
+        fast_hash = self._meta.get('fast_hash', FAST_HASH)
+        verify_types = [self._read_verify_type() for _ in rows]
+        n_checks = sum(verify != VerifyTypes.NONE for verify in verify_types)
+
+        out = dict()
+        out['idx'] = indices
+        if with_map:
+            with self.metrics.stage('read_maps'):
+                maps = _read_rows(self.map_array, unique_indices)
+            with self.metrics.stage('verify'):
+                for row, map, verify in zip(rows, maps, verify_types):
+                    if not row.check('map', map, verify, fast_hash):
+                        raise ValueError('Something wrong with map array')
+            self.metrics.count('bytes_read', maps.nbytes)
+            with self.metrics.stage('unpack'):
+                out['map'] = self.layout.unpack(maps)[restore]
+        out['start_position'] = self._index.column('start_position')[unique_indices][restore]
+        out['end_position'] = self._index.column('end_position')[unique_indices][restore]
+
+        for feature in self.features:
+            feature_name = feature.name
+            norm_memmap = feature.norm_memmap(norm_type)
+            if norm_memmap is None or n_checks:
+                with self.metrics.stage('read_features'):
+                    feature_val = _read_rows(feature.memmap, unique_indices)
+                self.metrics.count('bytes_read', feature_val.nbytes)
+                with self.metrics.stage('verify'):
+                    for row, value, verify in zip(rows, feature_val, verify_types):
+                        if not row.has(feature_name):
+                            raise ValueError(f'No such feature {feature_name}')
+                        if not row.check(feature_name, value, verify, fast_hash):
+                            raise ValueError(f'Wrong feature {feature_name}')
+            with self.metrics.stage('normalize'):
+                if norm_memmap is None:
+                    out[feature_name] = feature.norm(feature_val, norm_type)[restore]
+                elif n_checks:
+                    # Нормированная копия не хешируется, значения берутся из проверенных строк
+                    out[feature_name] = feature.norm_copy(feature_val, norm_type)[restore]
+                else:
+                    out[feature_name] = _read_rows(norm_memmap, unique_indices)[restore]
+        self.metrics.count('samples_read', len(indices))
+        self.metrics.count('hash_checks', n_checks * (int(with_map) + len(self.features)))
+        return out
+
+    def norm_map(self, value, norm_type: NormTypes):
+        # Нормировка карт по статистике, собранной при генерации
+        map_stats = self._meta.get('map_stats')
+        if map_stats is None and norm_type != NormTypes.NONE:
+            raise ValueError('Storage has no map statistics, regenerate it')
+        match norm_type:
+            case NormTypes.NONE:
+                return empty_norm(value)
+            case NormTypes.MINMAX:
+                return minmax_norm(value, map_stats['min'], map_stats['max'])
+            case NormTypes.ZNORM:
+                return z_norm(value, map_stats['mean'], map_stats['std'])
+            case _:
+                raise ValueError(f'Unknown norm type {norm_type}')
+
+    def get_fourier(self, indices):
+        if self.fourier_array is None:
+            raise ValueError('Storage was generated without map spectra')
+        unique_indices, restore = np.unique(np.asarray(indices, dtype=np.int64), return_inverse=True)
+        return _read_rows(self.fourier_array, unique_indices)[restore]
+
+    def fast_get(self, idx):
+        return self._index[idx].to_dict()
+
+    def window_index(self, rebuild: bool = False):
+        # Строится один раз по таблице бинов cooler и хранится рядом с индексом;
+        # хранилище только для чтения - индекс остаётся в памяти.
+        # rebuild - построить заново и перезаписать файл (после генерации)
+        if self._window_index is None or rebuild:
+            path = f'{self.storage_path}/window_index.npz'
+            start_position = np.array(self._index.column('start_position')[:len(self)], dtype=np.int64)
+            end_position = np.array(self._index.column('end_position')[:len(self)], dtype=np.int64)
+            index = None
+            if not rebuild and os.path.exists(path):
+                index = WindowIndex.load(path)
+                # Файл от прошлой генерации в том же каталоге не подходит
+                if not (np.array_equal(index.start_position, start_position) and np.array_equal(index.end_position, end_position)):
+                    index = None
+            if index is None:
+                index = WindowIndex.from_cooler(self.clr, start_position, end_position)
+                if os.access(self.storage_path, os.W_OK):
+                    index.save(path)
+            self._window_index = index
+            self._metadata = None
+        return self._window_index
+
+    def metadata(self):
+        # Колоночный индекс окон без чтения карт и признаков
+        if self._metadata is None:
+            self._metadata = self.window_index().windows_to_regions(np.arange(len(self)))
+        return self._metadata
@@ -0,0 +1,120 @@
+import os
+import numpy as np
+
+
+# Индекс окон хранилища в геномных координатах: таблица бинов cooler в виде массивов
+# и позиции окон. Бины переводятся в сквозную координату генома, поэтому запросы
+# в обе стороны решаются одним searchsorted на весь батч
+class WindowIndex():
+    def __init__(
+        self,
+        chrom_names: np.array,
+        chrom_lengths: np.array,
+        bin_chrom: np.array,  # Номер хромосомы для каждого бина
+        bin_start: np.array,
+        bin_end: np.array,
+        start_position: np.array,  # Первый бин окна
+        end_position: np.array  # Бин после последнего бина окна
+    ):
+        self.chrom_names = np.asarray(chrom_names, dtype=str)
+        self.chrom_lengths = np.asarray(chrom_lengths, dtype=np.int64)
+        self.bin_chrom = np.asarray(bin_chrom, dtype=np.int32)
+        self.bin_start = np.asarray(bin_start, dtype=np.int64)
+        self.bin_end = np.asarray(bin_end, dtype=np.int64)
+        self.start_position = np.asarray(start_position, dtype=np.int64)
+        self.end_position = np.asarray(end_position, dtype=np.int64)
+        if np.any(np.diff(self.start_position) < 0):
+            raise ValueError('Windows must be sorted by start position')
+        self._chrom_ids = {name: pos for pos, name in enumerate(self.chrom_names)}
+        self._genome_offsets = np.concatenate([[0], np.cumsum(self.chrom_lengths)]).astype(np.int64)
+        self._bin_start_genome = self._genome_offsets[self.bin_chrom] + self.bin_start
+        self._bin_end_genome = self._genome_offsets[self.bin_chrom] + self.bin_end
+
+    @classmethod
+    def from_cooler(cls, clr, start_position: np.array, end_position: np.array):
+        bins = clr.bins()[['chrom', 'start', 'end']][:]
+        return cls(
+            clr.chromnames,
+            clr.chromsizes.to_numpy(),
+            bins['chrom'].cat.codes.to_numpy(),
+            bins['start'].to_numpy(),
+            bins['end'].to_numpy(),
+            start_position,
+            end_position
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as inf:
+            return cls(**{key: inf[key] for key in inf.files})
+
+    def save(self, path: str):
+        with open(f'{path}.tmp', 'wb') as outf:
+            np.savez(
+                outf,
+                chrom_names=self.chrom_names,
+                chrom_lengths=self.chrom_lengths,
+                bin_chrom=self.bin_chrom,
+                bin_start=self.bin_start,
+                bin_end=self.bin_end,
+                start_position=self.start_position,
+                end_position=self.end_position
+            )
+        os.replace(f'{path}.tmp', path)
+
+    def __len__(self):
+        return len(self.start_position)
+
+    def bins(self, positions):
+        # Хромосома, начало и конец бинов по их номерам
+        positions = np.asarray(positions, dtype=np.int64)
+        return self.chrom_names[self.bin_chrom[positions]], self.bin_start[positions], self.bin_end[positions]
+
+    def windows_to_regions(self, indices):
+        # Геномные координаты окон: (idx, start_position, end_position, chrom, start, end_chrom, end)
+        import pandas as pd
+        indices = np.asarray(indices, dtype=np.int64)
+        start_position = self.start_position[indices]
+        end_position = self.end_position[indices]
+        chrom, start, _ = self.bins(start_position)
+        end_chrom, _, end = self.bins(end_position - 1)
+        return pd.DataFrame(dict(
+            idx=indices,
+            start_position=start_position,
+            end_position=end_position,
+            chrom=chrom.astype(object),
+            start=start,
+            end_chrom=end_chrom.astype(object),
+            end=end
+        ))
+
+    def regions_to_windows(
+        self,
+        regions,  # Таблица в формате BED: колонки chrom, start, end
+        contained: bool = True  # True - окна целиком внутри региона, False - любое пересечение
+    ):
+        # Возвращает пары (номер региона, idx окна), регионы в порядке таблицы
+        chroms = np.asarray(regions['chrom'], dtype=str)
+        chrom_ids = np.array([self._chrom_ids.get(chrom, -1) for chrom in chroms], dtype=np.int64)
+        known = chrom_ids >= 0
+        chrom_ids = np.where(known, chrom_ids, 0)
+        lengths = self.chrom_lengths[chrom_ids]
+        offsets = self._genome_offsets[chrom_ids]
+        region_start = offsets + np.clip(np.asarray(regions['start'], dtype=np.int64), 0, lengths)
+        region_end = offsets + np.clip(np.asarray(regions['end'], dtype=np.int64), 0, lengths)
+
+        if contained:
+            lo = np.searchsorted(self._bin_start_genome, region_start, side='left')
+            hi = np.searchsorted(self._bin_end_genome, region_end, side='right')
+            first = np.searchsorted(self.start_position, lo, side='left')
+            last = np.searchsorted(self.end_position, hi, side='right')
+        else:
+            lo = np.searchsorted(self._bin_end_genome, region_start, side='right')
+            hi = np.searchsorted(self._bin_start_genome, region_end, side='left')
+            first = np.searchsorted(self.end_position, lo, side='right')
+            last = np.searchsorted(self.start_position, hi, side='left')
+        counts = np.where(known & (region_end > region_start), np.maximum(last - first, 0), 0)
+
+        region_ids = np.repeat(np.arange(len(chroms), dtype=np.int64), counts)
+        shifts = np.repeat(first - (np.cumsum(counts) - counts), counts)
+        return region_ids, np.arange(counts.sum(), dtype=np.int64) + shifts
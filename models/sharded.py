@@ -0,0 +1,222 @@
+import os
+import json
+from typing import List
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .datastorage import DiscStorage
+from .reader import StorageReader
+from .features.norms import NormTypes
+from .integrity import VerifyTypes
+
+
+def _feature_names(spec: dict):
+    # В старых манифестах признаки записаны только именами
+    return [feature if isinstance(feature, str) else feature['name'] for feature in spec['features']]
+
+
+def _build_shard(
+    root: str,
+    name: str,
+    cooler_path: str,
+    resolution: int,
+    window_size: int,
+    features_fnc: callable,
+    generate_kwargs: dict
+):
+    # Шард - обычное хранилище DiscStorage в подкаталоге, cooler подключается ссылкой
+    storage_path = f'{root}/{name}'
+    if not os.path.exists(storage_path):
+        os.mkdir(storage_path)
+    cooler_name = os.path.basename(cooler_path)
+    if not os.path.exists(f'{storage_path}/{cooler_name}'):
+        os.symlink(os.path.abspath(cooler_path), f'{storage_path}/{cooler_name}')
+    storage = DiscStorage(storage_path, cooler_name, force_rewrite=True)
+    features = features_fnc(storage_path, f'{storage_path}/{cooler_name}::resolutions/{resolution}')
+    storage.generate_dataset(resolution, window_size, features, force_rewrite=True, **generate_kwargs)
+    # Схема признаков и статистика карт: шарды сверяются по манифесту, не открывая хранилища
+    schema = [
+        {key: value for key, value in feature.to_dict().items() if key != 'path'}
+        for feature in storage.features
+    ]
+    return dict(
+        name=name,
+        path=name,
+        cooler=cooler_name,
+        resolution=resolution,
+        window_size=window_size,
+        length=len(storage),
+        features=schema,
+        map_stats=storage._meta.get('map_stats')
+    )
+
+
+def build_shards(
+    root: str,
+    specs: List[dict],  # cooler_path, resolution, window_size и необязательное name для каждого шарда
+    features_fnc: callable,  # (storage_path, cooler_uri) -> List[Feature], должна сериализоваться pickle
+    n_workers: int = 1,  # Число шардов, которые строятся одновременно
+    **generate_kwargs
+):
+    if not os.path.exists(root):
+        os.makedirs(root)
+    tasks = []
+    for spec in specs:
+        name = spec.get('name')
+        if name is None:
+            name = f'{os.path.splitext(os.path.basename(spec["cooler_path"]))[0]}_{spec["resolution"]}'
+        tasks.append((root, name, spec['cooler_path'], spec['resolution'], spec['window_size'], features_fnc, generate_kwargs))
+    if len({task[1] for task in tasks}) != len(tasks):
+        raise ValueError('Shard names must be unique')
+
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            shards = list(executor.map(_build_shard, *zip(*tasks)))
+    else:
+        shards = [_build_shard(*task) for task in tasks]
+
+    manifest = dict(shards=shards)
+    with open(f'{root}/manifest.tmp.json', 'w') as outf:
+        json.dump(manifest, outf, indent=2)
+    os.replace(f'{root}/manifest.tmp.json', f'{root}/manifest.json')
+    return ShardedStorage(root)
+
+
+# Набор хранилищ под одним манифестом с глобальной нумерацией окон;
+# шарды открываются при первом обращении
+class ShardedStorage():
+    def __init__(
+        self,
+        root: str,
+        shards: List[str] = None,  # Имена шардов; None - все из манифеста
+        verify: VerifyTypes = VerifyTypes.FULL,
+        verify_every: int = 100
+    ):
+        self.root = root.rstrip('/')
+        if not os.path.exists(f'{self.root}/manifest.json'):
+            raise FileNotFoundError('Manifest did not exists')
+        with open(f'{self.root}/manifest.json', 'r') as inf:
+            self.manifest = json.load(inf)
+        self.shards = self.manifest['shards']
+        if shards is not None:
+            by_name = {shard['name']: shard for shard in self.shards}
+            missing = [name for name in shards if name not in by_name]
+            if missing:
+                raise ValueError(f'Unknown shards {missing}')
+            self.shards = [by_name[name] for name in shards]
+        if len({shard['window_size'] for shard in self.shards}) > 1:
+            raise ValueError('Shards with different window sizes can not be read together')
+        if len({tuple(_feature_names(shard)) for shard in self.shards}) > 1:
+            raise ValueError('Shards with different feature sets can not be read together')
+        dtypes = {
+            (feature['name'], feature.get('dtype'))
+            for shard in self.shards for feature in shard['features'] if isinstance(feature, dict)
+        }
+        if len(dtypes) > len({name for name, _ in dtypes}):
+            raise ValueError('Shards store features with different dtypes')
+        self.verify = verify
+        self.verify_every = verify_every
+        self.offsets = np.concatenate([[0], np.cumsum([shard['length'] for shard in self.shards])]).astype(np.int64)
+        self._storages = dict()
+        self._metadata = None
+
+    def __getstate__(self):
+        # Воркеры открывают шарды заново
+        state = self.__dict__.copy()
+        state['_storages'] = dict()
+        return state
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def storage(self, shard: int):
+        storage = self._storages.get(shard)
+        if storage is None:
+            spec = self.shards[shard]
+            storage = StorageReader(
+                f'{self.root}/{spec["path"]}',
+                spec['cooler'],
+                verify=self.verify,
+                verify_every=self.verify_every
+            )
+            storage.load_index()
+            self._storages[shard] = storage
+        return storage
+
+    @property
+    def window_size(self):
+        return self.shards[0]['window_size']
+
+    @property
+    def features(self):
+        return self.storage(0).features
+
+    def shard_window_index(self, idx: int):
+        # Индекс окон шарда и номер окна в нём: координаты окна - бины cooler этого шарда
+        shards, local = self.locate([idx])
+        return self.storage(int(shards[0])).window_index(), int(local[0])
+
+    def locate(self, indices):
+        # Глобальные индексы -> (номер шарда, локальный индекс)
+        indices = np.asarray(indices, dtype=np.int64)
+        if np.any(indices < 0) or np.any(indices >= len(self)):
+            raise KeyError('Index out of range')
+        shards = np.searchsorted(self.offsets, indices, side='right') - 1
+        return shards, indices - self.offsets[shards]
+
+    def __getitem__(self, idx):
+        norm_type = NormTypes.NONE
+        if isinstance(idx, tuple):
+            idx, norm_type = idx
+        shards, local = self.locate([idx])
+        out = self.storage(int(shards[0]))[int(local[0]), norm_type]
+        out['idx'] = idx
+        out['shard'] = int(shards[0])
+        return out
+
+    def _grouped(self, indices, read_fnc: callable):
+        # Читает окна пошардово и собирает результат в порядке запроса
+        indices = np.asarray(indices, dtype=np.int64)
+        shards, local = self.locate(indices)
+        parts = dict()
+        for shard in np.unique(shards):
+            positions = np.flatnonzero(shards == shard)
+            parts[int(shard)] = (positions, read_fnc(self.storage(int(shard)), local[positions]))
+        return parts
+
+    def get_batch(self, indices, norm_type: NormTypes = NormTypes.NONE, with_map: bool = True):
+        indices = np.asarray(indices, dtype=np.int64)
+        parts = self._grouped(indices, lambda storage, local: storage.get_batch(local, norm_type, with_map))
+        out = dict()
+        for positions, batch in parts.values():
+            for key, value in batch.items():
+                if key not in out:
+                    out[key] = np.empty((len(indices), *value.shape[1:]), dtype=value.dtype)
+                out[key][positions] = value
+        out['idx'] = indices
+        out['shard'] = self.locate(indices)[0]
+        return out
+
+    def get_fourier(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        parts = self._grouped(indices, lambda storage, local: storage.get_fourier(local))
+        out = None
+        for positions, value in parts.values():
+            if out is None:
+                out = np.empty((len(indices), *value.shape[1:]), dtype=value.dtype)
+            out[positions] = value
+        return out
+
+    def metadata(self):
+        # Метаданные всех шардов с глобальным idx и описанием шарда
+        if self._metadata is None:
+            frames = []
+            for shard, spec in enumerate(self.shards):
+                frame = self.storage(shard).metadata().copy()
+                frame['idx'] = frame['idx'] + self.offsets[shard]
+                frame['shard'] = spec['name']
+                frame['cooler'] = spec['cooler']
+                frame['resolution'] = spec['resolution']
+                frames.append(frame)
+            self._metadata = pd.concat(frames, ignore_index=True)
+        return self._metadata
@@ -0,0 +1,124 @@
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import List
+import numpy as np
+
+
+# Кэш готовых окон (карта и признаки в float32) в разделяемой памяти: его видят все
+# воркеры DataLoader. Слоты вытесняются по часовому алгоритму, доступ под общей блокировкой
+class SharedWindowCache():
+    def __init__(
+        self,
+        n_windows: int,  # Длина хранилища, индекс окна -> слот хранится плотным массивом
+        window_size: int,
+        feature_names: List[str],
+        max_bytes: int,  # Бюджет памяти под данные слотов
+        norm_type=None,  # Нормировка, с которой окна кладутся в кэш
+        context: str = None  # Контекст multiprocessing воркеров DataLoader ('fork', 'spawn', ...)
+    ):
+        self.n_windows = n_windows
+        self.window_size = window_size
+        self.feature_names = list(feature_names)
+        self.norm_type = norm_type
+        self.slot_size = window_size * window_size + len(self.feature_names) * window_size
+        self.n_slots = int(max_bytes // (self.slot_size * np.dtype(np.float32).itemsize))
+        if self.n_slots < 1:
+            raise ValueError('Cache budget is smaller than one window')
+        self.lock = multiprocessing.get_context(context).Lock()
+        self._shm = shared_memory.SharedMemory(create=True, size=self._layout()[-1])
+        self._owner = True
+        self._attach()
+        self.slot_index[:] = -1
+        self.slot_owner[:] = -1
+        self.slot_ref[:] = 0
+        self.counters[:] = 0
+
+    def _layout(self):
+        # Смещения массивов внутри одного блока разделяемой памяти
+        sizes = [
+            self.n_slots * self.slot_size * 4,  # данные слотов, float32
+            self.n_windows * 8,  # окно -> слот
+            self.n_slots * 8,  # слот -> окно
+            self.n_slots,  # бит обращения
+            3 * 8  # стрелка часов, попадания, промахи
+        ]
+        return np.concatenate([[0], np.cumsum(sizes)])
+
+    def _attach(self):
+        offsets = self._layout()
+        buf = self._shm.buf
+        self.data = np.ndarray((self.n_slots, self.slot_size), dtype=np.float32, buffer=buf, offset=offsets[0])
+        self.slot_index = np.ndarray((self.n_windows, ), dtype=np.int64, buffer=buf, offset=offsets[1])
+        self.slot_owner = np.ndarray((self.n_slots, ), dtype=np.int64, buffer=buf, offset=offsets[2])
+        self.slot_ref = np.ndarray((self.n_slots, ), dtype=np.uint8, buffer=buf, offset=offsets[3])
+        self.counters = np.ndarray((3, ), dtype=np.int64, buffer=buf, offset=offsets[4])
+
+    def __getstate__(self):
+        state = {
+            key: value for key, value in self.__dict__.items()
+            if key not in ('_shm', 'data', 'slot_index', 'slot_owner', 'slot_ref', 'counters')
+        }
+        state['_name'] = self._shm.name
+        state['_owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        name = state.pop('_name')
+        self.__dict__.update(state)
+        # Трекер ресурсов у воркеров общий с родителем, блок удаляет только владелец в close
+        self._shm = shared_memory.SharedMemory(name=name)
+        self._attach()
+
+    def _split(self, slot_data: np.array):
+        w = self.window_size
+        item = slot_data[:w * w].reshape(w, w)
+        features = slot_data[w * w:].reshape(len(self.feature_names), w)
+        return item, [features[pos] for pos in range(len(self.feature_names))]
+
+    def get(self, idx: int):
+        # Копия данных под блокировкой: слот может быть вытеснен сразу после выхода
+        with self.lock:
+            slot = self.slot_index[idx]
+            if slot < 0:
+                self.counters[2] += 1
+                return None
+            self.slot_ref[slot] = 1
+            self.counters[1] += 1
+            slot_data = self.data[slot].copy()
+        return self._split(slot_data)
+
+    def put(self, idx: int, item: np.array, features: List[np.array]):
+        slot_data = np.concatenate([
+            np.asarray(item, dtype=np.float32).reshape(-1),
+            *[np.asarray(feature, dtype=np.float32).reshape(-1) for feature in features]
+        ])
+        with self.lock:
+            if self.slot_index[idx] >= 0:
+                return
+            hand = int(self.counters[0])
+            while self.slot_ref[hand]:
+                self.slot_ref[hand] = 0
+                hand = (hand + 1) % self.n_slots
+            self.counters[0] = (hand + 1) % self.n_slots
+            evicted = self.slot_owner[hand]
+            if evicted >= 0:
+                self.slot_index[evicted] = -1
+            self.data[hand] = slot_data
+            self.slot_owner[hand] = idx
+            self.slot_index[idx] = hand
+            self.slot_ref[hand] = 1
+
+    def stats(self):
+        return dict(
+            slots=self.n_slots,
+            used=int((self.slot_owner >= 0).sum()),
+            hits=int(self.counters[1]),
+            misses=int(self.counters[2])
+        )
+
+    def close(self):
+        for name in ('data', 'slot_index', 'slot_owner', 'slot_ref', 'counters'):
+            self.__dict__.pop(name, None)
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+
+# Векторные предикаты для HiCMapDataset: получают DiscStorage.metadata()
+# и возвращают булеву маску окон, карты при этом не читаются
+def vectorized(split_fnc: callable):
+    split_fnc.vectorized = True
+    return split_fnc
+
+
+def by_chromosome(*chroms: str):
+    @vectorized
+    def split_fnc(frame: pd.DataFrame):
+        return (frame['chrom'].isin(chroms) & frame['end_chrom'].isin(chroms)).to_numpy()
+    return split_fnc
+
+
+def by_interval(chrom: str, start: int, end: int):
+    @vectorized
+    def split_fnc(frame: pd.DataFrame):
+        return (
+            (frame['chrom'] == chrom) & (frame['end_chrom'] == chrom)
+            & (frame['start'] >= start) & (frame['end'] <= end)
+        ).to_numpy()
+    return split_fnc
+
+
+def exclude(other: callable):
+    @vectorized
+    def split_fnc(frame: pd.DataFrame):
+        return np.logical_not(other(frame))
+    return split_fnc
+
+
+def by_shard(*shards: str):
+    # Для ShardedStorage: окна только из перечисленных шардов
+    @vectorized
+    def split_fnc(frame: pd.DataFrame):
+        return frame['shard'].isin(shards).to_numpy()
+    return split_fnc
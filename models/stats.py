@@ -0,0 +1,71 @@
+import numpy as np
+
+
+# Потоковые min/max/mean/std (Welford, слияние блоков по Chan et al.)
+class RunningStats():
+    def __init__(
+        self,
+        count: int = 0,
+        mean: float = 0.0,
+        m2: float = 0.0,  # Сумма квадратов отклонений от среднего
+        min: float = np.inf,
+        max: float = -np.inf
+    ):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    @classmethod
+    def from_values(cls, values: np.array):
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return cls()
+        mean = float(values.mean())
+        return cls(
+            count=int(values.size),
+            mean=mean,
+            m2=float(np.square(values - mean).sum()),
+            min=float(values.min()),
+            max=float(values.max())
+        )
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        return cls(state['count'], state['mean'], state['m2'], state['min'], state['max'])
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            mean=self.mean,
+            m2=self.m2,
+            min=self.min,
+            max=self.max
+        )
+
+    def update(self, values: np.array):
+        return self.merge(RunningStats.from_values(values))
+
+    def merge(self, other: 'RunningStats'):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = float(np.minimum(self.min, other.min))
+        self.max = float(np.maximum(self.max, other.max))
+        return self
+
+    @property
+    def std(self):
+        # Смещённая оценка, как у np.std
+        if self.count == 0:
+            return float('nan')
+        return float(np.sqrt(self.m2 / self.count))
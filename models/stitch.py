@@ -0,0 +1,211 @@
+import os
+import shutil
+from typing import List
+import numpy as np
+import pandas as pd
+import cooler
+try:
+    import pyBigWig
+except ImportError:
+    pyBigWig = None
+
+
+def blend_weights(window_size: int, kind='triangle'):
+    # Вес бина внутри окна; у краёв меньше, так как там соседнее окно видит больше контекста
+    if not isinstance(kind, str):
+        weights = np.asarray(kind, dtype=np.float64)
+        if weights.shape != (window_size, ):
+            raise ValueError(f'Weights must have shape ({window_size}, )')
+        return weights
+    x = (np.arange(window_size) + 0.5) / window_size
+    match kind:
+        case 'uniform':
+            return np.ones(window_size)
+        case 'triangle':
+            return 1 - np.abs(2 * x - 1)
+        case 'hann':
+            return np.sin(np.pi * x) ** 2
+        case _:
+            raise ValueError(f'Unknown weights {kind}')
+
+
+# Потоковая сборка предсказаний по окнам в карту и треки всего генома.
+# Окна должны приходить в порядке start_position (DataLoader без перемешивания):
+# тогда всё левее начала очередного окна уже не изменится и сбрасывается на диск.
+# В памяти только полоса chunk_size + window_size бинов вдоль диагонали
+class Stitcher():
+    def __init__(
+        self,
+        cooler_entity,  # cooler.Cooler или URI: таблица бинов для результата
+        out_path: str,  # Путь к .cool; треки пишутся рядом как {out}.{name}.bw или .bedgraph
+        window_size: int,
+        feature_names: List[str] = (),
+        weights='triangle',  # uniform, triangle, hann или массив весов длины window_size
+        chunk_size: int = 8192  # Сколько бинов копить перед сбросом на диск
+    ):
+        if isinstance(cooler_entity, str):
+            cooler_entity = cooler.Cooler(cooler_entity)
+        self.bins = cooler_entity.bins()[['chrom', 'start', 'end']][:]
+        self.chromsizes = cooler_entity.chromsizes
+        self.n_bins = len(self.bins)
+        self.out_path = out_path
+        self.window_size = window_size
+        self.feature_names = list(feature_names)
+        self.chunk_size = chunk_size
+
+        weights = blend_weights(window_size, weights)
+        self._track_weights = weights
+        rows, cols = np.triu_indices(window_size)
+        # Полоса хранится по диагоналям: ячейка (строка, j - i), окно - это сдвиг плоских индексов
+        self._rows, self._cols = rows, cols
+        self._band_index = rows * window_size + (cols - rows)
+        self._map_weights = (weights[rows] * weights[cols])
+
+        capacity = chunk_size + window_size
+        self._capacity = capacity
+        self._lo = 0
+        self._values = np.zeros((capacity, window_size))
+        self._weights = np.zeros((capacity, window_size))
+        self._tracks = {name: np.zeros(capacity) for name in self.feature_names}
+        self._track_sums = np.zeros(capacity)
+        self._has_map = False
+
+        self._parts_path = f'{out_path}.parts'
+        if os.path.exists(self._parts_path):
+            shutil.rmtree(self._parts_path)
+        os.makedirs(self._parts_path)
+        self._parts = []
+        self._writers = {name: self._open_track(name) for name in self.feature_names}
+        self._closed = False
+
+    def _open_track(self, name: str):
+        if pyBigWig is not None:
+            writer = pyBigWig.open(f'{self.out_path}.{name}.bw', 'w')
+            writer.addHeader([(chrom, int(size)) for chrom, size in self.chromsizes.items()])
+            return writer
+        return open(f'{self.out_path}.{name}.bedgraph', 'w')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._cleanup()
+
+    def add(
+        self,
+        start_positions,  # Первый бин каждого окна
+        maps=None,  # (n, window_size, window_size) или (n, 1, window_size, window_size)
+        tracks: dict = None  # Имя признака -> (n, window_size)
+    ):
+        # Комплексный вход (после ifft2d) берётся по действительной части
+        start_positions = np.asarray(start_positions, dtype=np.int64)
+        if len(start_positions) == 0:
+            return
+        order = np.argsort(start_positions, kind='stable')
+        start_positions = start_positions[order]
+        if start_positions[0] < self._lo:
+            raise ValueError('Windows must come in order of start position')
+        if maps is not None:
+            maps = np.real(np.asarray(maps)).reshape(-1, self.window_size, self.window_size)[order]
+            # Карта симметризуется, хранится только верхний треугольник
+            maps = (maps[:, self._rows, self._cols] + maps[:, self._cols, self._rows]) / 2
+            self._has_map = True
+        tracks = dict() if tracks is None else tracks
+        tracks = {name: np.real(np.asarray(tracks[name])).reshape(-1, self.window_size)[order] for name in tracks}
+        if tracks and set(tracks) != set(self.feature_names):
+            raise ValueError(f'Expected tracks {self.feature_names}, got {sorted(tracks)}')
+
+        for pos, start in enumerate(start_positions):
+            if start + self.window_size > self.n_bins:
+                raise ValueError(f'Window at {start} is out of cooler bins')
+            while start + self.window_size > self._lo + self._capacity:
+                self._flush(start)
+            row = start - self._lo
+            if maps is not None:
+                index = row * self.window_size + self._band_index
+                self._values.reshape(-1)[index] += maps[pos] * self._map_weights
+                self._weights.reshape(-1)[index] += self._map_weights
+            if tracks:
+                self._track_sums[row:row + self.window_size] += self._track_weights
+                for name, values in tracks.items():
+                    self._tracks[name][row:row + self.window_size] += values[pos] * self._track_weights
+
+    def add_batch(self, dataset, indices, maps=None, tracks: dict = None):
+        # Позиции окон берутся из датасета по индексам батча
+        start_positions = [dataset.get_coordinates(idx)[0] for idx in indices]
+        self.add(start_positions, maps, tracks)
+
+    def _flush(self, upto: int):
+        # Строки левее upto окончательные: пишем их и сдвигаем полосу
+        count = min(upto, self._lo + self._capacity) - self._lo
+        if count <= 0:
+            return
+        if self._has_map:
+            weights = self._weights[:count]
+            rows, diags = np.nonzero(weights > 0)
+            if len(rows):
+                bin1 = self._lo + rows
+                part = f'{self._parts_path}/{len(self._parts)}.npz'
+                np.savez(
+                    part,
+                    bin1_id=bin1,
+                    bin2_id=bin1 + diags,
+                    count=self._values[rows, diags] / weights[rows, diags]
+                )
+                self._parts.append(part)
+        covered = np.flatnonzero(self._track_sums[:count] > 0)
+        if len(covered):
+            bins = self.bins.iloc[self._lo + covered]
+            for name in self.feature_names:
+                values = self._tracks[name][covered] / self._track_sums[covered]
+                self._write_track(name, bins, values)
+
+        for array in [self._values, self._weights, self._track_sums, *self._tracks.values()]:
+            array[:-count] = array[count:]
+            array[-count:] = 0
+        self._lo += count
+
+    def _write_track(self, name: str, bins: pd.DataFrame, values: np.array):
+        writer = self._writers[name]
+        if pyBigWig is not None:
+            writer.addEntries(
+                bins['chrom'].astype(str).tolist(),
+                bins['start'].tolist(),
+                ends=bins['end'].tolist(),
+                values=values.tolist()
+            )
+        else:
+            frame = bins.assign(value=values)
+            frame.to_csv(writer, sep='\t', header=False, index=False)
+
+    def _pixels(self):
+        for part in self._parts:
+            with np.load(part) as inf:
+                yield pd.DataFrame({key: inf[key] for key in ['bin1_id', 'bin2_id', 'count']})
+
+    def close(self):
+        if self._closed:
+            return
+        while self._lo < self.n_bins:
+            self._flush(self.n_bins)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = dict()
+        if self._has_map:
+            cooler.create_cooler(
+                self.out_path,
+                self.bins,
+                self._pixels(),
+                dtypes={'count': np.float64},
+                ordered=True
+            )
+        self._cleanup()
+
+    def _cleanup(self):
+        for writer in self._writers.values():
+            writer.close()
+        shutil.rmtree(self._parts_path, ignore_errors=True)
+        self._closed = True
@@ -0,0 +1,200 @@
+import os
+import json
+import argparse
+from typing import List
+import numpy as np
+import torch
+from .dataset import FourierModes, fft1d, fft2d
+from .features.norms import NormTypes
+from .reader import StorageReader
+
+
+def export_shards(
+    storage,
+    out_path: str,
+    norm_types: List[NormTypes] = (NormTypes.NONE, ),  # Для каких нормировок сохранить признаки
+    indices=None,  # Окна для экспорта, например new_index датасета; None - все
+    samples_per_shard: int = 1024,
+    seed: int = 0  # Перемешивание окон перед разбиением на шарды
+):
+    # Окна хранилища в перемешанном порядке, по samples_per_shard в файле: чтение при
+    # обучении становится последовательным чтением целых файлов
+    if not os.path.exists(out_path):
+        os.makedirs(out_path)
+    if os.path.exists(f'{out_path}/shards.json'):
+        raise FileExistsError(f'Shards already exported to {out_path}')
+    if len(norm_types) == 0:
+        raise ValueError('At least one norm type is required')
+    indices = np.arange(len(storage)) if indices is None else np.asarray(indices, dtype=np.int64)
+    indices = np.random.default_rng(seed).permutation(indices)
+    feature_names = [feature.name for feature in storage.features]
+
+    shards = []
+    for first in range(0, len(indices), samples_per_shard):
+        chunk = indices[first:first + samples_per_shard]
+        # Карты читаются один раз, для остальных нормировок - только признаки
+        batch = storage.get_batch(chunk, norm_types[0])
+        arrays = dict(map=batch['map'].astype(np.float32))
+        for key in ['idx', 'start_position', 'end_position']:
+            arrays[key] = np.asarray(batch[key], dtype=np.int64)
+        for pos, norm_type in enumerate(norm_types):
+            if pos > 0:
+                batch = storage.get_batch(chunk, norm_type, with_map=False)
+            for name in feature_names:
+                arrays[f'{name}.{norm_type.name}'] = batch[name].astype(np.float32)
+        name = f'shard_{len(shards):05d}.npz'
+        with open(f'{out_path}/{name}.tmp', 'wb') as outf:
+            np.savez(outf, **arrays)
+        os.replace(f'{out_path}/{name}.tmp', f'{out_path}/{name}')
+        shards.append(dict(file=name, length=len(chunk)))
+
+    manifest = dict(
+        shards=shards,
+        length=int(len(indices)),
+        window_size=int(storage.window_size),
+        features=feature_names,
+        norm_types=[norm_type.name for norm_type in norm_types],
+        seed=seed
+    )
+    with open(f'{out_path}/shards.json.tmp', 'w') as outf:
+        json.dump(manifest, outf, indent=2)
+    os.replace(f'{out_path}/shards.json.tmp', f'{out_path}/shards.json')
+    return manifest
+
+
+# Потоковый аналог HiCMapDataset для экспортированных шардов. Шарды делятся между
+# процессами (rank) и воркерами DataLoader детерминированно по seed и эпохе,
+# внутри потока окна перемешиваются буфером
+class ShardDataset(torch.utils.data.IterableDataset):
+    def __init__(
+        self,
+        shards_path: str,
+        norm_type: NormTypes,
+        is_fourier: bool,
+        fourier_mode: FourierModes = FourierModes.SAMPLE,
+        shuffle: bool = True,
+        buffer_size: int = 4096,  # Размер буфера перемешивания (в окнах)
+        seed: int = 0,
+        rank: int = None,  # None - из torch.distributed, если он инициализирован
+        world_size: int = None,
+        even: bool = True  # Одинаковое число окон на каждый rank; лишние окна пропускаются
+    ):
+        if fourier_mode == FourierModes.STORED:
+            raise ValueError('Shards have no stored map spectra, use FourierModes.SAMPLE or BATCH')
+        self.shards_path = shards_path.rstrip('/')
+        with open(f'{self.shards_path}/shards.json', 'r') as inf:
+            self.manifest = json.load(inf)
+        if norm_type.name not in self.manifest['norm_types']:
+            raise ValueError(f'Shards were exported without {norm_type.name} features')
+        self.norm_type = norm_type
+        self.is_fourier = is_fourier
+        self.fourier_mode = fourier_mode
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        self.seed = seed
+        if rank is None or world_size is None:
+            distributed = torch.distributed.is_available() and torch.distributed.is_initialized()
+            rank = torch.distributed.get_rank() if distributed else 0
+            world_size = torch.distributed.get_world_size() if distributed else 1
+        self.rank = rank
+        self.world_size = world_size
+        self.even = even
+        self.epoch = 0
+        self._slice_size = self.manifest['window_size']
+        self.features = self.manifest['features']
+
+    def set_epoch(self, epoch: int):
+        # Вызывается перед каждой эпохой, как DistributedSampler.set_epoch
+        self.epoch = epoch
+
+    def _rank_shards(self):
+        # Шарды rank и сколько окон брать из каждого. При even у всех rank поровну окон:
+        # иначе последний короткий шард даёт разную длину эпохи и коллективы DDP зависают
+        shards = self.manifest['shards']
+        order = np.arange(len(shards))
+        if self.shuffle:
+            order = np.random.default_rng((self.seed, self.epoch)).permutation(order)
+        if not self.even:
+            return [(shards[pos], shards[pos]['length']) for pos in order[self.rank::self.world_size]]
+        common = min(
+            sum(shards[pos]['length'] for pos in order[rank::self.world_size])
+            for rank in range(self.world_size)
+        )
+        out = []
+        for pos in order[self.rank::self.world_size]:
+            take = min(shards[pos]['length'], common)
+            out.append((shards[pos], take))
+            common -= take
+        return out
+
+    def __len__(self):
+        return sum(take for _, take in self._rank_shards())
+
+    def _samples(self, shards):
+        keys = [f'{name}.{self.norm_type.name}' for name in self.features]
+        for shard, take in shards:
+            if take == 0:
+                continue
+            with np.load(f'{self.shards_path}/{shard["file"]}') as inf:
+                maps = inf['map'][:take]
+                features = [inf[key][:take] for key in keys]
+            for pos in range(len(maps)):
+                yield maps[pos], [values[pos] for values in features]
+
+    def __iter__(self):
+        shards = self._rank_shards()
+        worker_info = torch.utils.data.get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+        shards = shards[worker_id::num_workers]
+        rng = np.random.default_rng((self.seed, self.epoch, self.rank, worker_id))
+
+        samples = self._samples(shards)
+        if self.shuffle:
+            samples = self._buffered(samples, rng)
+        for item, features in samples:
+            yield self._to_tensors(item, features)
+
+    def _buffered(self, samples, rng: np.random.Generator):
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.buffer_size:
+                buffer.append(sample)
+                continue
+            pos = rng.integers(len(buffer))
+            yield buffer[pos]
+            buffer[pos] = sample
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def _to_tensors(self, item, features):
+        item = torch.from_numpy(item).reshape(1, self._slice_size, self._slice_size)
+        features = [torch.from_numpy(obj).reshape((1, self._slice_size)) for obj in features]
+        if self.is_fourier and self.fourier_mode == FourierModes.SAMPLE:
+            features = [fft1d(obj) for obj in features]
+            item = fft2d(item)
+        return item, *features
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a storage into pre-shuffled sequential shards')
+    parser.add_argument('storage', help='Storage directory')
+    parser.add_argument('out', help='Output directory for shards')
+    parser.add_argument('--norm-types', nargs='+', default=['NONE'], choices=[norm_type.name for norm_type in NormTypes])
+    parser.add_argument('--samples-per-shard', type=int, default=1024)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    storage = StorageReader(args.storage)
+    storage.load_index()
+    manifest = export_shards(
+        storage,
+        args.out,
+        [NormTypes[name] for name in args.norm_types],
+        samples_per_shard=args.samples_per_shard,
+        seed=args.seed
+    )
+    print(f'Exported {manifest["length"]} windows into {len(manifest["shards"])} shards')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,13 @@
 import numpy as np
 from cooltools.lib.numutils import observed_over_expected, interp_nan
+from .metrics import Metrics, NULL_METRICS
 
 
 def hic_transform(
     hic_map: np.array,
-    framesize: int
+    framesize: int,
+    expected: np.array = None,  # Готовая матрица expected; None - оценка по самому окну
+    metrics: Metrics = NULL_METRICS
 ):
     submap = hic_map[framesize:2*framesize, framesize:2*framesize]
     not_na_columns_mark = np.logical_not(np.isnan(submap)).sum(axis=0) != 0
@@ -13,8 +16,27 @@ def hic_transform(
 
     item = hic_map
     not_na_mask = np.logical_not(np.all(np.isnan(item), axis=0))
-    item, _, _, _ = observed_over_expected(item, mask=not_na_mask)
-    item = interp_nan(item)
-    item[item == 0.0] = np.quantile(a=item[item != 0], q=0.05)
-    item = np.log2(item)
+    with metrics.stage('observed_over_expected'):
+        if expected is None:
+            item, _, _, _ = observed_over_expected(item, mask=not_na_mask)
+        else:
+            item = item / expected
+    with metrics.stage('interp_nan'):
+        item = interp_nan(item)
+    with metrics.stage('quantile_fill'):
+        item[item == 0.0] = np.quantile(a=item[item != 0], q=0.05)
+        item = np.log2(item)
     return True, item[framesize:2*framesize, framesize:2*framesize]
+
+
+def select_windows(
+    weight: np.array,
+    framesize: int,
+    candidates: np.array
+):
+    # Предсказывает вердикт hic_transform по весам балансировки: столбец центрального
+    # окна целиком NaN, если NaN его вес или веса всех строк окна
+    valid = np.concatenate([[0], np.cumsum(np.logical_not(np.isnan(weight)))])
+    left_border = framesize * candidates // 2
+    valid_columns = valid[left_border + framesize] - valid[left_border]
+    return candidates[valid_columns / framesize >= 0.9]
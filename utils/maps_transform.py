@@ -4,7 +4,8 @@ from cooltools.lib.numutils import observed_over_expected, interp_nan
 
 def hic_transform(
     hic_map: np.array,
-    framesize: int
+    framesize: int,
+    expected: np.array = None  # Готовая матрица expected; None - оценка по самому окну
 ):
     submap = hic_map[framesize:2*framesize, framesize:2*framesize]
     not_na_columns_mark = np.logical_not(np.isnan(submap)).sum(axis=0) != 0
@@ -13,7 +14,10 @@ def hic_transform(
 
     item = hic_map
     not_na_mask = np.logical_not(np.all(np.isnan(item), axis=0))
-    item, _, _, _ = observed_over_expected(item, mask=not_na_mask)
+    if expected is None:
+        item, _, _, _ = observed_over_expected(item, mask=not_na_mask)
+    else:
+        item = item / expected
     item = interp_nan(item)
     item[item == 0.0] = np.quantile(a=item[item != 0], q=0.05)
     item = np.log(item)